@@ -0,0 +1,109 @@
+# agents/claim_check.py
+import os
+import re
+
+import numpy as np
+
+import tracing
+from agents.context import split_sentences
+from retrieval.bm25 import tokenize
+
+#A claim is supported locally when most of its word trigrams appear verbatim in a cited source,
+#or when a fair share do and its embedding is close to the source's
+CLAIM_SUPPORTED_OVERLAP = float(os.getenv("CLAIM_SUPPORTED_OVERLAP", "0.6"))
+CLAIM_PARTIAL_OVERLAP = float(os.getenv("CLAIM_PARTIAL_OVERLAP", "0.3"))
+CLAIM_SUPPORTED_SIMILARITY = float(os.getenv("CLAIM_SUPPORTED_SIMILARITY", "0.85"))  # cosine, claim vs chunk
+MIN_CLAIM_TERMS = 4  # greetings, sign-offs and headings are not claims
+
+VERDICTS = ("SUPPORTED", "PARTIALLY SUPPORTED", "NOT FOUND IN SOURCES", "CONTRADICTS SOURCES")
+EMAIL_BOILERPLATE = re.compile(r"^(dear|hi|hello|kind regards|best regards|regards|sincerely|subject:)", re.IGNORECASE)
+
+
+def split_claims(draft):
+    """Checkable claims of a Writer draft: summary and email sentences and action descriptions."""
+    claims = []
+
+    def add(field, text, index=None):
+        if len(tokenize(text)) >= MIN_CLAIM_TERMS and not EMAIL_BOILERPLATE.match(text):
+            claims.append({"id": len(claims) + 1, "field": field, "index": index, "text": text})
+
+    for sentence in split_sentences(str(draft.get("executive_summary", ""))):
+        add("executive_summary", sentence)
+    for sentence in split_sentences(str(draft.get("client_email", ""))):
+        add("client_email", sentence.lstrip("-• ").strip())
+    for i, action in enumerate(draft.get("action_list") or []):
+        if isinstance(action, dict) and action.get("description"):
+            add("action_list", str(action["description"]), i)
+    return claims
+
+
+def _ngrams(tokens, n=3):
+    if len(tokens) < n:
+        return {tuple(tokens)} if tokens else set()
+    return {tuple(tokens[i:i + n]) for i in range(len(tokens) - n + 1)}
+
+
+def overlap_score(claim, source_grams):
+    """Share of the claim's word trigrams found in a source (1.0 = copied verbatim)."""
+    grams = _ngrams(tokenize(claim))
+    return len(grams & source_grams) / len(grams) if grams else 0.0
+
+
+def check_claims(claims, sources, embeddings=None):
+    """
+    Score each claim against the source texts ({citation: text}). Sets "overlap",
+    "source" (best-matching citation), optionally "similarity", and "verdict" =
+    "SUPPORTED" for strongly supported claims or None for claims that need the LLM.
+    Embeddings (a LangChain Embeddings, e.g. the cached one) are only computed for
+    claims in the uncertain overlap band.
+    """
+    with tracing.span("claims.check", claims=len(claims), sources=len(sources)) as span:
+        _check_claims(claims, sources, embeddings)
+        span.set(supported=sum(claim["verdict"] == "SUPPORTED" for claim in claims))
+        return claims
+
+
+def _check_claims(claims, sources, embeddings):
+    source_grams = {citation: _ngrams(tokenize(text)) for citation, text in sources.items()}
+    uncertain = []
+    for claim in claims:
+        scores = {citation: overlap_score(claim["text"], grams) for citation, grams in source_grams.items()}
+        best = max(scores, key=scores.get, default=None)
+        claim["overlap"] = round(scores[best], 3) if best else 0.0
+        claim["source"] = best
+        claim["verdict"] = "SUPPORTED" if claim["overlap"] >= CLAIM_SUPPORTED_OVERLAP else None
+        if claim["verdict"] is None and claim["overlap"] >= CLAIM_PARTIAL_OVERLAP:
+            uncertain.append(claim)
+
+    if embeddings is not None and uncertain:
+        citations = list(sources)
+        #Source chunks were embedded at indexing time, so these are embedding-cache hits
+        vectors = np.asarray(embeddings.embed_documents([sources[c] for c in citations] +
+                                                        [claim["text"] for claim in uncertain]), dtype="float32")
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        source_vectors, claim_vectors = vectors[:len(citations)], vectors[len(citations):]
+        for claim, vector in zip(uncertain, claim_vectors):
+            similarities = source_vectors @ vector
+            best = int(np.argmax(similarities))
+            claim["similarity"] = round(float(similarities[best]), 3)
+            if claim["similarity"] >= CLAIM_SUPPORTED_SIMILARITY:
+                claim["verdict"] = "SUPPORTED"
+                claim["source"] = citations[best]
+    return claims
+
+
+def annotate(draft, claims):
+    """Copy of the draft with each non-supported claim tagged in place, e.g. "... [NOT FOUND IN SOURCES]"."""
+    annotated = dict(draft)
+    if isinstance(draft.get("action_list"), list):
+        annotated["action_list"] = [dict(a) if isinstance(a, dict) else a for a in draft["action_list"]]
+    for claim in claims:
+        verdict = claim.get("verdict")
+        if verdict in (None, "SUPPORTED"):
+            continue
+        tagged = f"{claim['text']} [{verdict}]"
+        if claim["field"] == "action_list":
+            annotated["action_list"][claim["index"]]["description"] = tagged
+        else:
+            annotated[claim["field"]] = str(annotated[claim["field"]]).replace(claim["text"], tagged, 1)
+    return annotated
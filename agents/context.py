@@ -0,0 +1,155 @@
+# agents/context.py
+import os
+import re
+import math
+import threading
+
+import tracing
+from agents.llm import LLM_MODEL
+from retrieval.bm25 import tokenize
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "400"))  # research-note tokens per prompt
+MIN_SENTENCE_CHARS = 20  # shorter fragments (page numbers, headings cut by the splitter) are dropped
+MAX_SENTENCE_CHARS = 300  # PDF text often lacks punctuation; longer runs are cut at whitespace
+NOTE_OVERHEAD_TOKENS = 12  # citation line and bullet around each note
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken encoder for the LLM model, or False if unavailable (e.g. offline without a cached BPE file)."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                try:
+                    _encoder = tiktoken.encoding_for_model(LLM_MODEL)
+                except KeyError:
+                    _encoder = tiktoken.get_encoding("o200k_base")
+            except Exception as e:
+                print(f"⚠ tiktoken unavailable ({type(e).__name__}), estimating tokens from characters")
+                _encoder = False
+        return _encoder
+
+
+def count_tokens(text):
+    """Number of tokens in text for the LLM model (~4 characters per token if tiktoken is unavailable)."""
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+def split_sentences(text):
+    """Sentences of text, with run-ons longer than MAX_SENTENCE_CHARS cut into pieces at whitespace."""
+    sentences = []
+    for sentence in SENTENCE_RE.split(text):
+        sentence = sentence.strip()
+        while len(sentence) > MAX_SENTENCE_CHARS:
+            cut = sentence.rfind(" ", 0, MAX_SENTENCE_CHARS)
+            cut = cut if cut > MIN_SENTENCE_CHARS else MAX_SENTENCE_CHARS
+            sentences.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if len(sentence) >= MIN_SENTENCE_CHARS:
+            sentences.append(sentence)
+    return sentences
+
+
+def _normalize(sentence):
+    return " ".join(sentence.lower().split())
+
+
+def build_context(notes, query, budget=CONTEXT_TOKEN_BUDGET):
+    """
+    Compress research notes to fit a token budget.
+    Notes are split into sentences; sentences repeated across chunks (the splitter's
+    overlap) or contained in another sentence are dropped, and the rest are ranked by
+    IDF-weighted overlap with the query. Each note first gets its best sentence, then
+    the budget is filled best-first. Returns (notes with compressed "text", stats);
+    notes keep their order and kept sentences keep their original order.
+    """
+    with tracing.span("context.build", budget=budget) as span:
+        compressed, stats = _build_context(notes, query, budget)
+        span.set(context_tokens=stats["context_tokens"], source_tokens=stats["source_tokens"])
+        return compressed, stats
+
+
+def _build_context(notes, query, budget):
+    candidates = []  # (note index, position, sentence)
+    seen = set()
+    exact_duplicates = 0
+    source_tokens = 0
+    for i, note in enumerate(notes):
+        if not isinstance(note, dict) or note.get("supported") is False:
+            continue
+        text = note.get("text", "")
+        source_tokens += count_tokens(text)
+        for position, sentence in enumerate(split_sentences(text)):
+            key = _normalize(sentence)
+            if key in seen:
+                exact_duplicates += 1
+                continue
+            seen.add(key)
+            candidates.append((i, position, sentence))
+
+    #Overlap fragments at chunk boundaries are substrings of the full sentence in the neighbouring chunk
+    keys = [_normalize(sentence) for _, _, sentence in candidates]
+    kept = []
+    contained = 0
+    for (i, position, sentence), key in zip(candidates, keys):
+        if any(key != other and key in other for other in keys):
+            contained += 1
+        else:
+            kept.append((i, position, sentence))
+
+    sentence_terms = [set(tokenize(sentence)) for _, _, sentence in kept]
+    query_terms = set(tokenize(query or ""))
+    n = max(len(kept), 1)
+    idf = {term: math.log(1 + n / (1 + sum(term in terms for terms in sentence_terms))) for term in query_terms}
+
+    scored = []
+    for (i, position, sentence), terms in zip(kept, sentence_terms):
+        relevance = sum(idf[term] for term in query_terms & terms)
+        #Ties favour higher-ranked notes and earlier sentences
+        scored.append((relevance - 0.01 * i - 0.001 * position, i, position, sentence))
+    scored.sort(reverse=True)
+
+    #Best sentence of every note first (keeps each citation represented), then the rest by score
+    firsts, rest, covered = [], [], set()
+    for item in scored:
+        (rest if item[1] in covered else firsts).append(item)
+        covered.add(item[1])
+
+    selected = {}
+    notes_used = set()
+    used = 0
+    for _, i, position, sentence in firsts + rest:
+        cost = count_tokens(sentence) + (NOTE_OVERHEAD_TOKENS if i not in notes_used else 0)
+        if used + cost > budget:
+            continue
+        selected[(i, position)] = sentence
+        notes_used.add(i)
+        used += cost
+
+    compressed = []
+    for i, note in enumerate(notes):
+        if not isinstance(note, dict) or note.get("supported") is False:
+            compressed.append(note)
+            continue
+        sentences = [selected[key] for key in sorted(selected) if key[0] == i]
+        if sentences:
+            compressed.append(dict(note, text=" ".join(sentences)))
+
+    stats = {
+        "context_budget": budget,
+        "context_tokens": used,
+        "source_tokens": source_tokens,
+        "sentences_kept": len(selected),
+        "sentences_total": len(candidates) + exact_duplicates,
+        "duplicates_dropped": exact_duplicates + contained,
+    }
+    return compressed, stats
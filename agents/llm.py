@@ -0,0 +1,304 @@
+from dotenv import load_dotenv
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+
+import tracing
+
+#Load .env variables
+load_dotenv()
+
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", ".cache", "llm.sqlite"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))  # SDK retries with exponential backoff
+LLM_TIMEOUT_SEC = float(os.getenv("LLM_TIMEOUT_SEC", "60"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 0 = no rate limit
+COMPLETION_TOKEN_ESTIMATE = 800  # reserved per call until the real usage is known
+
+#USD per 1M (prompt, completion) tokens, for cost estimates in traces; LLM_PRICE_PER_1M="0.15,0.6" overrides
+LLM_PRICES_PER_1M = {"gpt-4o-mini": (0.15, 0.60), "gpt-4o": (2.50, 10.00), "gpt-4.1-mini": (0.40, 1.60)}
+if os.getenv("LLM_PRICE_PER_1M"):
+    LLM_PRICES_PER_1M[LLM_MODEL] = tuple(float(p) for p in os.getenv("LLM_PRICE_PER_1M").split(","))
+
+_client = None
+_client_lock = threading.Lock()
+
+_cache_lock = threading.Lock()
+_cache_conn = None
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+stats = {"calls": 0, "cache_hits": 0, "coalesced": 0, "rate_limited_sec": 0.0,
+         "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _count(key, amount=1):
+    with _stats_lock:
+        stats[key] += amount
+
+
+class TokenRateLimiter:
+    """
+    Token bucket shared by every LLM call in the process. Each call reserves its
+    estimated tokens before it is sent (blocking while the bucket is empty) and
+    settles the difference once the real usage is known.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens):
+        tokens = min(float(tokens), self.capacity)
+        start = time.monotonic()
+        with self.lock:
+            self._refill()
+            while self.tokens < tokens:
+                #settle() can wake waiters before the timeout, so the wait is measured, not summed
+                self.lock.wait((tokens - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= tokens
+        return time.monotonic() - start
+
+    def settle(self, reserved, actual):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + reserved - actual)
+            self.lock.notify_all()
+
+
+_rate_limiter = TokenRateLimiter(LLM_TOKENS_PER_MINUTE) if LLM_TOKENS_PER_MINUTE > 0 else None
+
+
+def set_rate_limit(tokens_per_minute):
+    """Set (or with 0/None remove) the process-wide token-per-minute limit."""
+    global _rate_limiter
+    _rate_limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+
+
+def estimate_tokens(messages):
+    """Rough prompt size (~4 characters per token)."""
+    return sum(len(str(m.get("content", ""))) for m in messages) // 4 + 4 * len(messages)
+
+
+def cost_usd(model, prompt_tokens, completion_tokens):
+    """Estimated price of a call, or None for a model without a known price."""
+    prices = LLM_PRICES_PER_1M.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1e6
+
+
+def _record_usage(model, messages, content, usage):
+    """Count a completed call's tokens and cost and attach them to the current llm.chat span."""
+    prompt_tokens = getattr(usage, "prompt_tokens", None) or estimate_tokens(messages)
+    completion_tokens = getattr(usage, "completion_tokens", None) or len(content or "") // 4
+    cost = cost_usd(model, prompt_tokens, completion_tokens)
+    with _stats_lock:
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["cost_usd"] += cost or 0.0
+    tracing.current_span().set(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               usage_reported=usage is not None, cost_usd=cost)
+    return prompt_tokens + completion_tokens
+
+
+def get_client():
+    """Process-wide OpenAI client over one pooled HTTP connection pool, with retry/backoff."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            #Imported on first use so importing the agents stays cheap
+            import httpx
+            from openai import OpenAI
+
+            _client = OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                max_retries=LLM_MAX_RETRIES,
+                timeout=LLM_TIMEOUT_SEC,
+                http_client=httpx.Client(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                        max_keepalive_connections=LLM_MAX_CONNECTIONS),
+                    timeout=LLM_TIMEOUT_SEC,
+                ),
+            )
+        return _client
+
+
+def _cache_db():
+    global _cache_conn
+    if _cache_conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(LLM_CACHE_PATH)), exist_ok=True)
+        _cache_conn = sqlite3.connect(LLM_CACHE_PATH, check_same_thread=False)
+        _cache_conn.execute("PRAGMA journal_mode=WAL")
+        _cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions ("
+            "key TEXT PRIMARY KEY, content TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+    return _cache_conn
+
+
+def cache_key(model, messages, params):
+    """Exact-prompt key: model + messages + request params."""
+    payload = json.dumps({"model": model, "messages": messages, "params": params}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key):
+    with _cache_lock:
+        db = _cache_db()
+        row = db.execute("SELECT content FROM completions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        db.execute("UPDATE completions SET last_used = ? WHERE key = ?", (time.time(), key))
+        db.commit()
+        return row[0]
+
+
+def _cache_put(key, content):
+    now = time.time()
+    with _cache_lock:
+        db = _cache_db()
+        db.execute("INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)", (key, content, now, now))
+        db.execute(
+            "DELETE FROM completions WHERE key NOT IN (SELECT key FROM completions ORDER BY last_used DESC LIMIT ?)",
+            (LLM_CACHE_MAX_ENTRIES,)
+        )
+        db.commit()
+
+
+def _complete(model, messages, params, on_token=None):
+    _count("calls")
+    limiter = _rate_limiter
+    reserved = estimate_tokens(messages) + COMPLETION_TOKEN_ESTIMATE
+    if limiter:
+        waited = limiter.acquire(reserved)
+        _count("rate_limited_sec", waited)
+        tracing.current_span().set(queue_ms=round(waited * 1000, 3))
+    try:
+        return _request(model, messages, params, on_token, limiter, reserved)
+    except BaseException:
+        if limiter:
+            limiter.settle(reserved, estimate_tokens(messages))
+        raise
+
+
+def _request(model, messages, params, on_token, limiter, reserved):
+    span = tracing.current_span()
+    start = time.perf_counter()
+    if on_token is None:
+        response = get_client().chat.completions.create(model=model, messages=messages, **params)
+        content = response.choices[0].message.content
+        used = _record_usage(model, messages, content, getattr(response, "usage", None))
+        if limiter:
+            limiter.settle(reserved, used)
+        return content
+
+    #Stream token deltas to the caller while assembling the full message; the final chunk carries the usage
+    parts = []
+    usage = None
+    stream = get_client().chat.completions.create(model=model, messages=messages, stream=True,
+                                                  stream_options={"include_usage": True}, **params)
+    for chunk in stream:
+        usage = getattr(chunk, "usage", None) or usage
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            if not parts:
+                span.set(ttft_ms=round((time.perf_counter() - start) * 1000, 3))
+            parts.append(delta)
+            on_token(delta)
+    content = "".join(parts)
+    used = _record_usage(model, messages, content, usage)
+    if limiter:
+        limiter.settle(reserved, used)
+    return content
+
+
+def chat(messages, model=LLM_MODEL, use_cache=True, on_token=None, **params):
+    """
+    Chat completion through the shared gateway; returns the message content.
+    Exact repeats are served from the persistent cache, and concurrent identical
+    requests are coalesced into a single API call. With on_token, the completion
+    is streamed and on_token(delta) is called for each token delta (cached or
+    coalesced results arrive as a single delta). Each call is an llm.chat span
+    carrying its source, rate-limit queue time, time-to-first-token, token usage
+    and estimated cost.
+    """
+    with tracing.span("llm.chat", model=model, stream=on_token is not None) as span:
+        content, source = _chat(messages, model, use_cache, on_token, params)
+        span.set(source=source, completion_chars=len(content or ""))
+        return content
+
+
+def _chat(messages, model, use_cache, on_token, params):
+    """Returns (content, source) where source is "cache", "coalesced" or "api"."""
+    use_cache = use_cache and LLM_CACHE_ENABLED
+    key = cache_key(model, messages, params)
+    if use_cache:
+        cached = _cache_get(key)
+        if cached is not None:
+            _count("cache_hits")
+            if on_token:
+                on_token(cached)
+            return cached, "cache"
+
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = _inflight[key] = Future()
+    if not leader:
+        _count("coalesced")
+        content = future.result()
+        if on_token:
+            on_token(content)
+        return content, "coalesced"
+
+    try:
+        #A request that just finished may have filled the cache while we waited for the lock
+        content = _cache_get(key) if use_cache else None
+        source = "cache"
+        if content is not None:
+            if on_token:
+                on_token(content)
+        else:
+            content, source = _complete(model, messages, params, on_token), "api"
+            if use_cache:
+                _cache_put(key, content)
+        future.set_result(content)
+        return content, source
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+def evict(messages, model=LLM_MODEL, **params):
+    """Drop a cached completion (e.g. one that failed validation) so it is not served again."""
+    if not LLM_CACHE_ENABLED:
+        return
+    with _cache_lock:
+        db = _cache_db()
+        db.execute("DELETE FROM completions WHERE key = ?", (cache_key(model, messages, params),))
+        db.commit()
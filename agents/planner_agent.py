@@ -1,19 +1,32 @@
-from dotenv import load_dotenv
-import os
-import json
-from openai import OpenAI
+from agents.structured import structured_chat
 
-#Load .env variables
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "overall_goal": {"type": "string"},
+        "subtasks": {"type": "array", "items": {
+            "type": "object",
+            "properties": {
+                "step": {"type": "integer"},
+                "task": {"type": "string"},
+                "agent": {"type": "string", "enum": ["Research", "Writer", "Verifier"]},
+                "priority": {"type": "string", "enum": ["High", "Medium", "Low"]},
+            },
+            "required": ["step", "task", "agent", "priority"],
+            "additionalProperties": False,
+        }},
+        "dependencies": {"type": "array", "items": {"type": "string"}},
+        "success_criteria": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["overall_goal", "subtasks", "dependencies", "success_criteria"],
+    "additionalProperties": False,
+}
 
-#Initialize OpenAI client
-client = OpenAI(api_key=api_key)
-
-def planner_agent(user_task):
+def planner_agent(user_task, stats=None):
     """
     Planner agent decomposes a user task into ordered subtasks with agent assignments.
-    Returns a structured plan as JSON.
+    Returns a structured plan (dict matching PLAN_SCHEMA).
+    If stats is a dict, parse failures are counted in it.
     """
     prompt = f"""
     You are a Planner Agent for a multi-agent system.
@@ -40,32 +53,5 @@ def planner_agent(user_task):
     Be concise and actionable.
     """
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    result_text = response.choices[0].message.content
-    
-    # Try to parse as JSON
-    try:
-        if "```json" in result_text:
-            json_str = result_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in result_text:
-            json_str = result_text.split("```")[1].split("```")[0].strip()
-        else:
-            json_str = result_text
-        
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        # Fallback: return plan as text
-        return {
-            "overall_goal": user_task,
-            "subtasks": [
-                {"step": 1, "task": "Research the topic", "agent": "Research", "priority": "High"},
-                {"step": 2, "task": "Generate deliverable", "agent": "Writer", "priority": "High"},
-                {"step": 3, "task": "Verify accuracy", "agent": "Verifier", "priority": "High"}
-            ],
-            "plan_text": result_text
-        }
+    return structured_chat([{"role": "user", "content": prompt}], PLAN_SCHEMA, "plan", stats_out=stats)
 
@@ -1,33 +1,95 @@
-from dotenv import load_dotenv
 import os
-from openai import OpenAI
-from retrieval.vector_store import retrieve
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+from retrieval.vector_store import retrieve, search_many, fuse_rankings, get_store, relevance_probe
 
-SIMILARITY_THRESHOLD = 0.5  # L2 distance threshold (stricter: reject off-topic queries)
+#L2 distance thresholds per index type (stricter: reject off-topic queries). Flat and HNSW
+#report exact distances; IVF-PQ distances come from compressed codes and run ~5% low
+#(see eval/ann_benchmark.py, distance_drift), so its threshold is scaled down to match
+SIMILARITY_THRESHOLDS = {
+    "flat": float(os.getenv("SIMILARITY_THRESHOLD_FLAT", "0.5")),
+    "hnsw": float(os.getenv("SIMILARITY_THRESHOLD_HNSW", "0.5")),
+    "ivfpq": float(os.getenv("SIMILARITY_THRESHOLD_IVFPQ", "0.47")),
+}
+MAX_QUERIES = 4  # raw task + research subtasks from the plan
+MIN_NOTES = 6  # research notes kept for a single query
 
-def research_agent(task):
+def research_queries(task, plan=None):
+    """One query for the raw task plus one per Research subtask of the plan."""
+    queries = [task]
+    if isinstance(plan, dict):
+        for subtask in plan.get("subtasks", []):
+            if isinstance(subtask, dict) and str(subtask.get("agent", "")).lower() == "research":
+                query = str(subtask.get("task", "")).strip()
+                if query and query not in queries:
+                    queries.append(query)
+    return queries[:MAX_QUERIES]
+
+def similarity_threshold(collection=None):
+    """Off-topic distance threshold for the type of a collection's index (IVF-PQ falls back to flat on small shards)."""
+    return SIMILARITY_THRESHOLDS.get(get_store(collection).index_type, SIMILARITY_THRESHOLDS["flat"])
+
+def _off_topic_note(best_score, threshold):
+    return {
+        "text": f"Query appears to be outside the domain of available supply chain documents. Best relevance score: {best_score:.3f} (threshold: {threshold}).",
+        "citation": "N/A",
+        "supported": False,
+        "reason": "Low relevance - out of domain"
+    }
+
+def domain_gate(task, collections=None):
+    """
+    The Research relevance check, run on the raw task before any agent: a k=1 dense
+    probe plus the BM25 exact-term check in each selected collection, no LLM call.
+    Returns None when some collection covers the task, otherwise the unsupported
+    note Research would have returned.
+    """
+    probes = relevance_probe(task, collections=collections)
+    if not probes:
+        return {"text": "No documents available in vector store.", "citation": "N/A", "supported": False}
+    for collection, best_score, lexical_match in probes:
+        if lexical_match or (best_score is not None and best_score <= similarity_threshold(collection)):
+            return None
+    collection, best_score, _ = min(probes, key=lambda p: float('inf') if p[1] is None else p[1])
+    return _off_topic_note(float('inf') if best_score is None else best_score, similarity_threshold(collection))
+
+def retrieve_task(task, stats=None, collections=None):
+    """Ranking for the raw task, deep enough to be fused with the subtask queries later."""
+    return retrieve(task, k=2 * MAX_QUERIES, stats=stats, collections=collections)
+
+def research_agent(task, plan=None, task_results=None, stats=None, collections=None):
     """
     Research agent retrieves documents and creates grounded notes with citations.
+    With a plan, one query per Research subtask is searched alongside the task in a
+    single batched call and the rankings are fused. task_results can carry the raw
+    task's ranking from retrieve_task when it was fetched ahead of time (e.g. while
+    the Planner ran), so only the subtask queries are embedded here.
+    If stats is a dict, rerank latency and query-cache hits are written to it.
+    collections selects the document collections searched (default: all of them).
     Returns list of dicts with 'text', 'citation', and 'supported' fields.
     """
-    results = retrieve(task, k=3)
+    queries = research_queries(task, plan)
+    k = max(MIN_NOTES, 2 * len(queries))  # chunks are ~CHUNK_TOKENS tokens, so two notes per query
+    if len(queries) == 1 and task_results is None:
+        results = retrieve(task, k=k, stats=stats, collections=collections)
+    else:
+        rankings = [task_results] if task_results is not None else []
+        rankings += search_many(queries[1:] if task_results is not None else queries, k=2 * k, stats=stats,
+                                collections=collections)
+        results = fuse_rankings(rankings, k=k)
     
     if not results:
         return [{"text": "No relevant documents found in knowledge base.", "citation": "N/A", "supported": False}]
     
-    #Accept if best match score < threshold
-    best_score = min(r.get("similarity_score", float('inf')) for r in results)
-    
-    if best_score > SIMILARITY_THRESHOLD:
-        return [{
-            "text": f"Query appears to be outside the domain of available supply chain documents. Best relevance score: {best_score:.3f} (threshold: {SIMILARITY_THRESHOLD}).",
-            "citation": "N/A",
-            "supported": False,
-            "reason": "Low relevance - out of domain"
-        }]
+    #Accept if best match score < threshold, or if BM25 found a confident exact-term match
+    #(lexical fast-path results carry no L2 score)
+    dense = [r for r in results if r.get("similarity_score") is not None]
+    best = min(dense, key=lambda r: r["similarity_score"], default=None)
+    best_score = best["similarity_score"] if best else float('inf')
+    lexical_match = any(r.get("lexical_confident") for r in results)
+    if not lexical_match:
+        threshold = similarity_threshold((best or results[0]).get("collection"))
+        if best_score > threshold:
+            return [_off_topic_note(best_score, threshold)]
     
     notes = []
     for result in results:
@@ -37,10 +99,13 @@ def research_agent(task):
         
         #Create research note with citation
         note = {
-            "text": result.get("text", "")[:500],  #Limit text length for notes
+            "text": result.get("text", ""),  #Full chunk; Writer/Verifier compress notes to their token budget
             "citation": result.get("citation", "N/A"),
             "doc_name": result.get("doc_name", "unknown"),
+            "section": result.get("section"),
+            "collection": result.get("collection"),
             "similarity_score": result.get("similarity_score", 0),
+            "bm25_score": result.get("bm25_score"),
             "supported": result.get("supported", True)
         }
         notes.append(note)
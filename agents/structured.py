@@ -0,0 +1,184 @@
+# agents/structured.py
+import re
+import json
+import threading
+
+import tracing
+from agents import llm
+
+PARTIAL_ESCAPE_RE = re.compile(r'\\(u[0-9a-fA-F]{0,3})?$')  # escape sequence cut off mid-stream
+
+stats = {"calls": 0, "parse_failures": 0, "repaired": 0, "failed": 0}
+_stats_lock = threading.Lock()
+
+
+class StructuredOutputError(ValueError):
+    """The model's reply did not match the schema, even after the repair retry."""
+
+    def __init__(self, name, error, text):
+        super().__init__(f"{name}: {error}")
+        self.name = name
+        self.error = error
+        self.text = text
+
+
+def _count(key):
+    with _stats_lock:
+        stats[key] += 1
+
+
+def validate(value, schema, path="$"):
+    """
+    Check value against the JSON-schema subset used for response formats
+    (type, properties, required, items, enum). Returns the first error or None.
+    """
+    expected = schema.get("type")
+    types = {"object": dict, "array": list, "string": str, "boolean": bool, "number": (int, float), "integer": int}
+    if expected in types and (not isinstance(value, types[expected]) or
+                              (expected in ("integer", "number") and isinstance(value, bool))):
+        return f"{path} should be {expected}"
+    if "enum" in schema and value not in schema["enum"]:
+        return f"{path} should be one of {schema['enum']}"
+    if expected == "object":
+        for key in schema.get("required", []):
+            if key not in value:
+                return f"{path}.{key} is missing"
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in value:
+                error = validate(value[key], sub_schema, f"{path}.{key}")
+                if error:
+                    return error
+    if expected == "array" and "items" in schema:
+        for i, item in enumerate(value):
+            error = validate(item, schema["items"], f"{path}[{i}]")
+            if error:
+                return error
+    return None
+
+
+def response_format(name, schema):
+    """OpenAI structured-output response_format for a strict JSON schema."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": True}}
+
+
+def parse(text, schema):
+    """Parse and validate a complete reply; returns (value, error)."""
+    with tracing.span("parse", chars=len(text)) as span:
+        value, error = _parse(text, schema)
+        span.set(valid=error is None)
+        return value, error
+
+
+def _parse(text, schema):
+    text = text.strip()
+    if text.startswith("```"):  # models without response_format support may still fence the JSON
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError as e:
+        return None, f"invalid JSON ({e})"
+    return value, validate(value, schema)
+
+
+def structured_chat(messages, schema, name, on_token=None, stats_out=None, **params):
+    """
+    Chat completion constrained to a JSON schema; returns the parsed object.
+    A reply that does not parse or validate is evicted from the LLM cache and
+    repaired once by sending the error back to the model; if the repaired reply is
+    still invalid, StructuredOutputError is raised. Parse failures are counted in
+    the module's stats and, if given, in stats_out["parse_failures"].
+    """
+    with tracing.span(f"structured.{name}"):
+        return _structured_chat(messages, schema, name, on_token, stats_out, params)
+
+
+def _structured_chat(messages, schema, name, on_token, stats_out, params):
+    _count("calls")
+    fmt = response_format(name, schema)
+    text = llm.chat(messages, on_token=on_token, response_format=fmt, **params)
+    value, error = parse(text, schema)
+    if error is None:
+        return value
+
+    _count("parse_failures")
+    tracing.current_span().set(repair=True, parse_error=error)
+    if stats_out is not None:
+        stats_out["parse_failures"] = stats_out.get("parse_failures", 0) + 1
+    llm.evict(messages, response_format=fmt, **params)
+
+    repair = messages + [
+        {"role": "assistant", "content": text},
+        {"role": "user", "content": f"That reply is not valid: {error}. "
+                                    f"Return only the corrected JSON object matching the schema."},
+    ]
+    text = llm.chat(repair, use_cache=False, response_format=fmt, **params)
+    value, error = parse(text, schema)
+    if error is None:
+        _count("repaired")
+        return value
+    _count("failed")
+    if stats_out is not None:
+        stats_out["parse_failures"] += 1
+    raise StructuredOutputError(name, error, text)
+
+
+def _close(text, stack, in_string):
+    if in_string:
+        text = PARTIAL_ESCAPE_RE.sub("", text) + '"'
+    return text + "".join("}" if opener == "{" else "]" for opener in reversed(stack))
+
+
+def parse_partial_json(text):
+    """
+    Best-effort parse of an incomplete JSON document, e.g. a reply that is still
+    streaming: open strings, arrays and objects are closed, and a trailing key or
+    unfinished value is dropped. Returns the parsed value, or None if nothing
+    complete enough has arrived yet.
+    """
+    start = text.find("{")
+    if start < 0:
+        return None
+    text = text[start:]
+    stack, in_string, escaped = [], False, False
+    safe = []  # (position, stack) where the document could be closed
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+                safe.append((i + 1, tuple(stack)))
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append(ch)
+            safe.append((i + 1, tuple(stack)))
+        elif ch in "}]":
+            if stack:
+                stack.pop()
+            safe.append((i + 1, tuple(stack)))
+            if not stack:
+                break
+        elif ch == ",":
+            safe.append((i, tuple(stack)))
+
+    candidates = [(len(text), tuple(stack), in_string)] + [(pos, st, False) for pos, st in reversed(safe)]
+    for pos, st, open_string in candidates[:8]:
+        try:
+            return json.loads(_close(text[:pos], st, open_string))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def partial_json_string(text, field):
+    """
+    Value of a top-level JSON string field from a possibly incomplete JSON
+    document (see parse_partial_json). Returns "" if the field has not started yet.
+    """
+    value = parse_partial_json(text)
+    if isinstance(value, dict) and isinstance(value.get(field), str):
+        return value[field]
+    return ""
@@ -1,63 +1,94 @@
-from dotenv import load_dotenv
-import os
-import json
-from openai import OpenAI
+from agents.structured import structured_chat
+from agents.context import build_context, count_tokens, CONTEXT_TOKEN_BUDGET
+from agents.claim_check import split_claims, check_claims, annotate, VERDICTS
+from retrieval.vector_store import get_embeddings
+from retrieval.chunker import indexed_text
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+VERDICT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "verdicts": {"type": "array", "items": {
+            "type": "object",
+            "properties": {
+                "id": {"type": "integer"},
+                "verdict": {"type": "string", "enum": list(VERDICTS)},
+            },
+            "required": ["id", "verdict"],
+            "additionalProperties": False,
+        }},
+    },
+    "required": ["verdicts"],
+    "additionalProperties": False,
+}
 
-def verifier_agent(draft, research_notes):
+def _source_texts(draft, research_notes):
+    """
+    Texts of the notes the draft cites (all notes if it cites none), keyed by citation,
+    as they were embedded at indexing time (title and section, then the full chunk).
+    """
+    notes = {n["citation"]: indexed_text(n) for n in research_notes
+             if isinstance(n, dict) and n.get("supported") is not False and n.get("citation") not in (None, "N/A")}
+    cited = {c for c in draft.get("sources_cited") or [] if c in notes}
+    return {c: t for c, t in notes.items() if c in cited} if cited else notes
+
+def verifier_agent(draft, research_notes, on_token=None, stats=None, context_budget=CONTEXT_TOKEN_BUDGET):
     """
     Verify claims in the draft against research notes.
-    Mark unsupported claims with "Not found in sources" flags.
+    Claims are first checked locally (n-gram overlap, then cached embeddings); only
+    the uncertain ones are sent to the LLM, which returns a verdict per claim, and
+    the call is skipped when none are. The notes are compressed to the sentences
+    most relevant to those claims within context_budget tokens.
+    Returns {"draft": draft with unsupported claims tagged, e.g. "[NOT FOUND IN SOURCES]",
+    "claims": [{"id", "field", "text", "verdict", "checked_by" ("local", "llm" or
+    "unchecked"), "source", "overlap", ...}]}.
+    If on_token is given, the completion is streamed and on_token(delta) receives each token.
+    If stats is a dict, claim counts, prompt/context token counts and parse failures are written to it.
     """
-    notes_text = ""
-    if isinstance(research_notes, list):
-        for note in research_notes:
-            if isinstance(note, dict):
-                notes_text += f"Source: {note.get('citation', 'N/A')}\n{note.get('text', '')}\n\n"
-            else:
-                notes_text += f"{note}\n\n"
-    else:
-        notes_text = str(research_notes)
-    
-    draft_text = ""
-    if isinstance(draft, dict):
-        draft_text = json.dumps(draft, indent=2)
-    else:
-        draft_text = str(draft)
-    
-    prompt = f"""
-    You are a Verifier Agent. Check claims in the draft against the research sources.
-    
+    sources = _source_texts(draft, research_notes)
+    claims = split_claims(draft)
+    if sources:
+        check_claims(claims, sources, get_embeddings())
+    uncertain = [claim for claim in claims if claim["verdict"] is None]
+    for claim in claims:
+        #Without sources the LLM call is skipped, so undecided claims stay unchecked
+        claim["checked_by"] = "local" if claim["verdict"] else "llm" if sources else "unchecked"
+
+    if stats is not None:
+        stats.update({"claims_total": len(claims), "claims_local": len(claims) - len(uncertain),
+                      "claims_llm": len(uncertain) if sources else 0, "prompt_tokens": 0})
+
+    #No sources means Research found nothing and the Writer already produced the NOT FOUND deliverable
+    if uncertain and sources:
+        claims_text = "\n".join(f"{claim['id']}. {claim['text']}" for claim in uncertain)
+        #Only the cited notes reach the prompt, so only they share the budget
+        cited_notes = [n for n in research_notes if isinstance(n, dict) and n.get("citation") in sources]
+        notes, context_stats = build_context(cited_notes, claims_text, context_budget)
+        notes_text = ""
+        for note in notes:
+            notes_text += f"Source: {note.get('citation')}\n{note.get('text', '')}\n\n"
+
+        prompt = f"""
+    You are a Verifier Agent. Check each claim against the research sources.
+
     RESEARCH SOURCES (ground truth):
     {notes_text}
-    
-    DRAFT TO VERIFY:
-    {draft_text}
-    
+
+    CLAIMS TO VERIFY:
+    {claims_text}
+
     Instructions:
-    1. For each claim in the draft, check if it's supported by the research sources
-    2. If a claim is NOT supported, mark it with [NOT FOUND IN SOURCES]
-    3. If a claim is partially supported, mark it with [PARTIALLY SUPPORTED]
-    4. If a claim contradicts sources, mark it with [CONTRADICTS SOURCES]
-    5. Preserve all citations from the draft
-    6. Return verified content in the same JSON format if applicable
-    
-    Return ONLY the verified version of the draft with annotations.
+    For each claim decide whether it is SUPPORTED, PARTIALLY SUPPORTED, NOT FOUND IN SOURCES
+    or CONTRADICTS SOURCES, based only on the research sources.
+
+    Return a JSON object: {{"verdicts": [{{"id": 1, "verdict": "SUPPORTED"}}, ...]}}
     """
-    
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    verified = response.choices[0].message.content
-    
-    #Ensure "Not found in sources" appears for unsupported claims
-    if "[NOT FOUND IN SOURCES]" not in verified and "not found" not in verified.lower():
-        #Check if any sources were actually used
-        if "citation" not in verified.lower() and len(research_notes) == 0:
-            verified = f"[NOT FOUND IN SOURCES]\n\nNo supporting research documents were available for this query.\n\n{verified}"
-    
-    return verified
+        if stats is not None:
+            stats.update(context_stats)
+            stats["prompt_tokens"] = count_tokens(prompt)
+        result = structured_chat([{"role": "user", "content": prompt}], VERDICT_SCHEMA, "claim_verdicts",
+                                 on_token=on_token, stats_out=stats)
+        verdicts = {item["id"]: item["verdict"] for item in result["verdicts"]}
+        for claim in uncertain:
+            claim["verdict"] = verdicts.get(claim["id"])
+
+    return {"draft": annotate(draft, claims), "claims": claims}
@@ -1,29 +1,78 @@
-from dotenv import load_dotenv
-import os
-import json
-from openai import OpenAI
+from agents.structured import structured_chat
+from agents.context import build_context, count_tokens, CONTEXT_TOKEN_BUDGET
 
-load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+DRAFT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "executive_summary": {"type": "string"},
+        "client_email": {"type": "string"},
+        "action_list": {"type": "array", "items": {
+            "type": "object",
+            "properties": {
+                "owner": {"type": "string"},
+                "due_date": {"type": "string"},
+                "confidence": {"type": "string", "enum": ["High", "Medium", "Low"]},
+                "description": {"type": "string"},
+            },
+            "required": ["owner", "due_date", "confidence", "description"],
+            "additionalProperties": False,
+        }},
+        "sources_cited": {"type": "array", "items": {"type": "string"}},
+    },
+    "required": ["executive_summary", "client_email", "action_list", "sources_cited"],
+    "additionalProperties": False,
+}
 
-def writer_agent(notes, output_type="executive"):
+#Deliverable sections that can be drafted (and verified) independently: name -> draft field
+SECTIONS = {"summary": "executive_summary", "email": "client_email", "actions": "action_list"}
+
+#Prompt line describing each field of the JSON reply
+FIELD_INSTRUCTIONS = {
+    "executive_summary": '"executive_summary": "Min 250 words summarizing key findings"',
+    "client_email": '"client_email": "A professional client email: greeting, summary of findings, 2-3 recommendations (bulleted), closing. Be concise and client-focused."',
+    "action_list": '''"action_list": [
+            {"owner": "Team/Person", "due_date": "YYYY-MM-DD format", "confidence": "High|Medium|Low", "description": "Action item"}
+        ]''',
+    "sources_cited": '"sources_cited": ["list of unique citations from research"]',
+}
+
+def draft_schema(fields):
+    """DRAFT_SCHEMA restricted to the given fields plus sources_cited."""
+    fields = [f for f in DRAFT_SCHEMA["required"] if f in fields or f == "sources_cited"]
+    return {**DRAFT_SCHEMA, "properties": {f: DRAFT_SCHEMA["properties"][f] for f in fields}, "required": fields}
+
+def not_found_draft():
+    """Canned deliverable for a task the documents do not cover (no LLM call)."""
+    return {
+        "executive_summary": "NOT FOUND IN SOURCES - The query appears to be outside the domain of available supply chain documents.",
+        "client_email": "Dear Client,\n\nUnfortunately, we were unable to find relevant information in our knowledge base to address your query. The topic appears to be outside the scope of our available supply chain management documents.\n\nSuggested Next Steps:\n- Provide additional context or rephrasing of your question\n- Clarify which supply chain topic (resilience, coordination, security, performance, etc.) your query relates to\n- Consider uploading additional documents if they exist\n\nWe've gathered what we could but cannot provide a confident answer without relevant source material.\n\nKind Regards,\nSupply Chain Analysis Team",
+        "action_list": [{"owner": "Documentation Team", "due_date": "2026-02-23", "confidence": "Low", "description": "Acquire or upload documents relevant to this query topic"}],
+        "sources_cited": []
+    }
+
+def writer_agent(notes, output_type="executive", on_token=None, query=None, stats=None,
+                 context_budget=CONTEXT_TOKEN_BUDGET, fields=None):
     """
     Generate structured output with executive summary, email, and action list.
-    Notes should be a list of dicts with 'text' and 'citation' fields.
+    Notes should be a list of dicts with 'text' and 'citation' fields; they are
+    compressed to the sentences most relevant to query within context_budget tokens.
+    If on_token is given, the completion is streamed and on_token(delta) receives each token.
+    If stats is a dict, prompt and context token counts and parse failures are written to it.
+    With fields (e.g. ["client_email"]), only those sections are written, in a shorter
+    prompt. Returns a dict matching draft_schema(fields), DRAFT_SCHEMA by default.
     """
+    schema = draft_schema(fields or DRAFT_SCHEMA["required"])
     # Check if notes indicate "not found" (research agent couldn't find relevant sources)
     if isinstance(notes, list) and len(notes) > 0:
         first_note = notes[0] if isinstance(notes[0], dict) else {}
         if first_note.get("supported") == False:
-            return {
-                "executive_summary": "NOT FOUND IN SOURCES - The query appears to be outside the domain of available supply chain documents.",
-                "client_email": "Dear Client,\n\nUnfortunately, we were unable to find relevant information in our knowledge base to address your query. The topic appears to be outside the scope of our available supply chain management documents.\n\nSuggested Next Steps:\n- Provide additional context or rephrasing of your question\n- Clarify which supply chain topic (resilience, coordination, security, performance, etc.) your query relates to\n- Consider uploading additional documents if they exist\n\nWe've gathered what we could but cannot provide a confident answer without relevant source material.\n\nKind Regards,\nSupply Chain Analysis Team",
-                "action_list": [{"owner": "Documentation Team", "due_date": "2026-02-23", "confidence": "N/A", "description": "Acquire or upload documents relevant to this query topic"}],
-                "sources_cited": []
-            }
+            return {f: v for f, v in not_found_draft().items() if f in schema["properties"]}
     
     notes_text = ""
     if isinstance(notes, list):
+        notes, context_stats = build_context(notes, query, context_budget)
+        if stats is not None:
+            stats.update(context_stats)
         for note in notes:
             if isinstance(note, dict):
                 notes_text += f"- {note.get('text', '')}\n  Citation: {note.get('citation', 'N/A')}\n"
@@ -32,6 +81,7 @@ def writer_agent(notes, output_type="executive"):
     else:
         notes_text = str(notes)
     
+    fields_text = ",\n        ".join(FIELD_INSTRUCTIONS[f] for f in schema["required"])
     prompt = f"""
     You are a Writer Agent. Create a professional deliverable.
     
@@ -40,38 +90,13 @@ def writer_agent(notes, output_type="executive"):
     
     Generate a JSON response with these exact fields:
     {{
-        "executive_summary": "Min 250 words summarizing key findings",
-        "client_email": "A professional client email: greeting, summary of findings, 2-3 recommendations (bulleted), closing. Be concise and client-focused.",
-        "action_list": [
-            {{"owner": "Team/Person", "due_date": "YYYY-MM-DD format", "confidence": "High|Medium|Low", "description": "Action item"}}
-        ],
-        "sources_cited": ["list of unique citations from research"]
+        {fields_text}
     }}
     
     Ensure all claims are grounded in the research notes provided.
     """
     
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    
-    result_text = response.choices[0].message.content
-    
-    try:
-        if "```json" in result_text:
-            json_str = result_text.split("```json")[1].split("```")[0].strip()
-        elif "```" in result_text:
-            json_str = result_text.split("```")[1].split("```")[0].strip()
-        else:
-            json_str = result_text
-        
-        return json.loads(json_str)
-    except json.JSONDecodeError:
-        #Fallback: return structured dict with the raw response
-        return {
-            "executive_summary": result_text[:150],
-            "client_email": f"Subject: Supply Chain Analysis\n\n{result_text}",
-            "action_list": [{"owner": "Team", "due_date": "2026-03-01", "confidence": "Medium", "description": result_text[:100]}],
-            "sources_cited": ["See research notes above"]
-        }
+    if stats is not None:
+        stats["prompt_tokens"] = count_tokens(prompt)
+    return structured_chat([{"role": "user", "content": prompt}], schema, "deliverable",
+                           on_token=on_token, stats_out=stats)
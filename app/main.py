@@ -4,7 +4,10 @@ import json
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 import streamlit as st
-from graph import run_copilot
+import altair as alt
+import tracing
+from graph import run_copilot_stream, partial_json_string
+from retrieval.vector_store import get_store, list_collections
 
 
 st.set_page_config(page_title="Enterprise Multi-Agent Copilot", layout="wide")
@@ -15,6 +18,10 @@ st.markdown("Transform supply chain business requests into structured, decision-
 with st.sidebar:
     st.header("⚙️ Configuration")
     st.info("This system uses 4 coordinated agents to deliver comprehensive analysis with full citations.")
+    #Each collection is a separately indexed document set (a subdirectory of data/), loaded on first use
+    available_collections = list_collections()
+    collections = st.multiselect("📚 Document collections", available_collections, default=available_collections[:1],
+                                 help="Search several collections in parallel; results are merged.")
 
 #Main content
 col1, col2 = st.columns([2, 1])
@@ -27,26 +34,47 @@ with col1:
 with col2:
     st.subheader("📊 Quick Info")
     st.metric("Agents", "4", "Plan → Research → Draft → Verify")
-    st.metric("Documents", "8", "Supply Chain Management")
+    #Collection indexes are loaded once per server process, on first use, and shared across reruns and sessions
+    with st.spinner("Loading document index..."):
+        documents = sum(len(get_store(c).chunks.documents()) for c in collections)
+    st.metric("Documents", str(documents), ", ".join(collections) or "No collection selected")
     st.metric("Citations", "Full Tracking", "Document + Chunk ID")
 
 #Run system
 if st.button("🚀 Run Multi-Agent Workflow", use_container_width=True, type="primary"):
     if not user_task.strip():
         st.error("Please enter a business task.")
+    elif not collections:
+        st.error("Please select at least one document collection.")
     else:
-        with st.spinner("🔄 Running multi-agent workflow..."):
-            try:
-                deliverable, trace_log, obs_table = run_copilot(user_task)
-                
-                # Store results in session for display
-                st.session_state.deliverable = deliverable
-                st.session_state.trace_log = trace_log
-                st.session_state.obs_table = obs_table
-                
-            except Exception as e:
-                st.error(f"❌ Error during execution: {str(e)}")
-                st.info("Make sure your OPENAI_API_KEY is set in .env file")
+        #Stream agent progress and render the executive summary as the Writer generates it
+        status = st.status("🔄 Running multi-agent workflow...", expanded=True)
+        summary_placeholder = st.empty()
+        draft_text = ""
+        try:
+            for event in run_copilot_stream(user_task, collections=collections):
+                if event["type"] == "agent_start":
+                    status.write(f"▶️ {event['agent']} started ({event['t']:.2f}s)")
+                elif event["type"] == "agent_end":
+                    status.write(f"✅ {event['agent']} finished in {event['latency_sec']:.2f}s")
+                elif event["type"] == "token" and event["agent"] == "Writer (summary)":
+                    draft_text += event["delta"]
+                    summary = partial_json_string(draft_text, "executive_summary")
+                    if summary:
+                        summary_placeholder.markdown(f"**Executive Summary (drafting...)**\n\n{summary}")
+                elif event["type"] == "done":
+                    # Store results in session for display
+                    st.session_state.deliverable = event["deliverable"]
+                    st.session_state.trace_log = event["trace_log"]
+                    st.session_state.obs_table = event["obs_table"]
+                    st.session_state.trace = event.get("trace")
+            status.update(label="✅ Multi-agent workflow complete", state="complete", expanded=False)
+            summary_placeholder.empty()
+
+        except Exception as e:
+            status.update(label="❌ Workflow failed", state="error")
+            st.error(f"❌ Error during execution: {str(e)}")
+            st.info("Make sure your OPENAI_API_KEY is set in .env file")
 
 #Display results if available
 if "deliverable" in st.session_state:
@@ -92,6 +120,17 @@ if "deliverable" in st.session_state:
                 st.write(f"{i}. `{source}`")
         else:
             st.warning("No sources cited. This may indicate [NOT FOUND IN SOURCES]")
+
+        claims = deliverable.get("claims", [])
+        if claims:
+            flagged = [c for c in claims if c.get("verdict") != "SUPPORTED"]
+            local = sum(1 for c in claims if c.get("checked_by") == "local")
+            llm = sum(1 for c in claims if c.get("checked_by") == "llm")
+            unchecked = f", {len(claims) - local - llm} unchecked" if local + llm < len(claims) else ""
+            st.markdown(f"**Claim verification:** {len(claims) - len(flagged)} of {len(claims)} claims supported "
+                        f"({local} checked locally, {llm} by the Verifier LLM{unchecked})")
+            for claim in flagged:
+                st.write(f"- `{claim.get('verdict') or 'UNVERIFIED'}` {claim['text']}")
     
     with tab5:
         st.subheader("Complete Workflow Trace")
@@ -102,9 +141,45 @@ if "deliverable" in st.session_state:
         for obs in st.session_state.obs_table:
             obs_data.append({
                 "Agent": obs["agent"],
-                "Latency (sec)": obs["latency_sec"]
+                "Latency (sec)": obs["latency_sec"],
+                "Start (sec)": obs.get("start_sec"),
+                "End (sec)": obs.get("end_sec"),
+                "TTFT (sec)": obs.get("ttft_sec"),
+                "Prompt tokens": obs.get("prompt_tokens"),
+                "Context tokens": obs.get("context_tokens"),
+                "Completion tokens": obs.get("llm_completion_tokens"),
+                "LLM cost ($)": obs.get("llm_cost_usd"),
+                "Rerank (ms)": obs.get("rerank_ms"),
+                "Cache hit": obs.get("cache_hit", "")
             })
         st.dataframe(obs_data, use_container_width=True)
+
+        #Span waterfall of this run: agents, embedding calls, FAISS, rerank, LLM calls, parsing
+        trace = st.session_state.get("trace")
+        if trace and trace.get("spans"):
+            st.markdown(f"**Span Waterfall** ({trace['duration_ms']:.0f} ms, trace `{trace['trace_id'][:8]}`)")
+            bars = [{
+                "span": f"{i:02d} " + "· " * row["depth"] + row["name"],
+                "start_ms": row["start_ms"],
+                "end_ms": row["start_ms"] + row["duration_ms"],
+                "duration_ms": row["duration_ms"],
+                "status": row["status"],
+                "attributes": json.dumps(row["attributes"], default=str)[:300],
+            } for i, row in enumerate(tracing.waterfall(trace))]
+            chart = alt.Chart(alt.Data(values=bars)).mark_bar().encode(
+                x=alt.X("start_ms:Q", title="ms since run start"),
+                x2="end_ms:Q",
+                y=alt.Y("span:N", sort=None, title=None),
+                color=alt.Color("status:N", legend=None),
+                tooltip=["span:N", "duration_ms:Q", "attributes:N"],
+            ).properties(height=22 * len(bars) + 40)
+            st.altair_chart(chart, use_container_width=True)
+
+        #Percentiles over the runs recorded in the trace sink
+        recent = tracing.load_traces(limit=200)
+        if recent:
+            st.markdown(f"**Span Latency Across Runs** (last {len(recent)} runs)")
+            st.dataframe(tracing.span_percentiles(recent), use_container_width=True)
         
         #Full trace log
         st.markdown("**Detailed Trace Log**")
@@ -0,0 +1,130 @@
+"""
+Batch mode: run many copilot tasks concurrently and stream results to JSONL.
+
+Input is a JSONL file with one task per line ({"id": ..., "task": ...}; a bare
+JSON string is also accepted and numbered by line). Each finished run is
+appended to the output file and flushed immediately, so a crashed or interrupted
+batch can be resumed: ids already present in the output are skipped.
+
+    python batch.py tasks.jsonl results.jsonl --concurrency 8 --tokens-per-minute 200000
+"""
+import os
+import json
+import time
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from agents import llm
+from graph import run_copilot
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+
+
+def read_tasks(path):
+    """Yield {"id", "task"} dicts from a JSONL file, skipping blank lines."""
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                item = {"id": line_no, "task": item}
+            yield {"id": item.get("id", line_no), "task": item["task"]}
+
+
+def completed_ids(path):
+    """Ids already written to an output file (for resuming); a torn last line is ignored."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                done.add(str(record["id"]))
+    return done
+
+
+def _run_one(item, use_cache):
+    start = time.perf_counter()
+    try:
+        deliverable, trace_log, obs_table = run_copilot(item["task"], use_cache=use_cache)
+        return {"id": item["id"], "task": item["task"], "deliverable": deliverable,
+                "obs_table": obs_table, "latency_sec": round(time.perf_counter() - start, 3)}
+    except Exception as e:
+        return {"id": item["id"], "task": item["task"], "error": f"{type(e).__name__}: {e}",
+                "latency_sec": round(time.perf_counter() - start, 3)}
+
+
+def run_batch(tasks, output_path, concurrency=BATCH_CONCURRENCY, tokens_per_minute=None,
+              use_cache=True, resume=True):
+    """
+    Run tasks (iterable of {"id", "task"}) through run_copilot with at most
+    `concurrency` pipelines in flight, appending each result to output_path as
+    soon as it finishes. tokens_per_minute sets the gateway's process-wide LLM
+    rate limit for the batch. Returns a summary dict.
+    """
+    if tokens_per_minute:
+        llm.set_rate_limit(tokens_per_minute)
+    done = completed_ids(output_path) if resume else set()
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+
+    summary = {"completed": 0, "failed": 0, "skipped": 0}
+    start = time.perf_counter()
+    with open(output_path, "a" if resume else "w", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=concurrency) as pool:
+        running = deque()
+
+        def write(finished):
+            for future in finished:
+                record = future.result()
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                summary["failed" if "error" in record else "completed"] += 1
+                status = "⚠" if "error" in record else "✓"
+                print(f"{status} [{record['id']}] {record['latency_sec']:.2f}s")
+
+        #Bounded submission so a large input file is never fully queued in memory
+        for item in tasks:
+            if str(item["id"]) in done:
+                summary["skipped"] += 1
+                continue
+            if len(running) >= concurrency * 2:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    running.remove(future)
+                write(finished)
+            running.append(pool.submit(_run_one, item, use_cache))
+        write(wait(running)[0])
+
+    summary["wall_sec"] = round(time.perf_counter() - start, 3)
+    runs = summary["completed"] + summary["failed"]
+    summary["runs_per_sec"] = round(runs / summary["wall_sec"], 3) if summary["wall_sec"] else None
+    summary["rate_limited_sec"] = round(llm.stats["rate_limited_sec"], 3)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run copilot tasks from a JSONL file concurrently")
+    parser.add_argument("input", help="JSONL file with one {\"id\", \"task\"} per line")
+    parser.add_argument("output", help="JSONL file results are appended to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--tokens-per-minute", type=int, default=None,
+                        help="LLM token-per-minute limit across all runs (default: LLM_TOKENS_PER_MINUTE)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the semantic response cache")
+    parser.add_argument("--restart", action="store_true", help="overwrite the output instead of resuming")
+    args = parser.parse_args()
+
+    summary = run_batch(read_tasks(args.input), args.output, concurrency=args.concurrency,
+                        tokens_per_minute=args.tokens_per_minute, use_cache=not args.no_cache,
+                        resume=not args.restart)
+    print("\n" + "="*60)
+    print("BATCH SUMMARY")
+    print("="*60)
+    for key, value in summary.items():
+        print(f"{key}: {value}")
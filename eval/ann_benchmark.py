@@ -0,0 +1,145 @@
+"""
+ANN index benchmark.
+
+Builds every index backend in retrieval/ann.py (flat, IVF-PQ, HNSW) over synthetic
+clustered unit vectors at several corpus sizes and reports build/train time,
+serialized size, recall@k against the exact flat index and single-query p50/p95
+latency, sweeping the query-time knobs (nprobe, efSearch). For IVF-PQ it also
+reports how far its approximate distances drift from the exact ones, which is
+what SIMILARITY_THRESHOLDS["ivfpq"] in agents/research_agent.py is calibrated on.
+
+    python eval/ann_benchmark.py --sizes 10000 50000 --dim 256 --output eval/results/ann_benchmark.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+import faiss
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from retrieval import ann
+from benchmark import percentile, git_commit
+
+
+def synthetic_vectors(n, dim, rng, clusters=None):
+    """Unit vectors around random topic centres sharing a common direction, like text embeddings."""
+    clusters = clusters or max(8, int(np.sqrt(n)))
+    common = rng.standard_normal(dim).astype("float32")
+    centres = rng.standard_normal((clusters, dim)).astype("float32") + 2 * common
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.05 * rng.standard_normal((n, dim)).astype("float32")
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def query_latency(index, queries, k):
+    """Per-query search latencies in milliseconds (one query per call, as the agents search)."""
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return {"p50": round(percentile(latencies, 50), 3), "p95": round(percentile(latencies, 95), 3)}
+
+
+def recall_at_k(found, exact, k):
+    return round(float(np.mean([len(set(f[:k]) & set(e[:k])) / k for f, e in zip(found, exact)])), 4)
+
+
+def distance_drift(index, vectors, queries, k):
+    """Reported / exact squared L2 distance of the returned neighbours (IVF-PQ distances are approximate)."""
+    distances, ids = index.search(queries, k)
+    ratios = []
+    for query, row_distances, row_ids in zip(queries, distances, ids):
+        for distance, row_id in zip(row_distances, row_ids):
+            exact = float(np.sum((vectors[row_id] - query) ** 2))
+            if row_id >= 0 and exact > 1e-6:
+                ratios.append(float(distance) / exact)
+    return {"median_ratio": round(percentile(ratios, 50), 3),
+            "p5_ratio": round(percentile(ratios, 5), 3),
+            "p95_ratio": round(percentile(ratios, 95), 3)}
+
+
+def bench_size(n, args, rng):
+    vectors = synthetic_vectors(n + args.queries, args.dim, rng)
+    vectors, queries = vectors[:n], vectors[n:]
+    row_ids = np.arange(n, dtype="int64")
+
+    exact_index = faiss.IndexFlatL2(args.dim)
+    exact_index.add(vectors)
+    _, exact = exact_index.search(queries, args.k)
+
+    sweeps = {"flat": [None], "ivfpq": args.nprobe, "hnsw": args.ef_search}
+    results = {}
+    for index_type in ("flat", "ivfpq", "hnsw"):
+        start = time.perf_counter()
+        index, kind = ann.create_index(vectors, index_type)
+        index.add_with_ids(vectors, row_ids)
+        build_sec = time.perf_counter() - start
+        size = len(faiss.serialize_index(index))
+
+        entry = {"type": kind, "build_sec": round(build_sec, 3), "bytes": int(size),
+                 "bytes_per_vector": round(size / n, 1), "settings": ann.index_settings(kind), "search": {}}
+        param = {"ivfpq": "nprobe", "hnsw": "efSearch"}.get(kind)
+        for value in sweeps[kind] if kind == index_type else [None]:
+            if param:
+                faiss.ParameterSpace().set_index_parameter(index, param, value)
+            _, found = index.search(queries, args.k)
+            entry["search"][f"{param}={value}" if param else "exact"] = {
+                f"recall@{args.k}": recall_at_k(found, exact, args.k),
+                "latency_ms": query_latency(index, queries, args.k),
+            }
+        if kind == "ivfpq":
+            ann.configure(index)
+            entry["distance_drift"] = distance_drift(index, vectors, queries, args.k)
+        results[index_type] = entry
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall/latency/memory of the ANN index backends vs flat")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--dim", type=int, default=256, help="vector dimension (text-embedding-ada-002 is 1536)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[32, 64, 128])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(ROOT, "eval", "results", "ann_benchmark.json"))
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    report = {
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k != "output"},
+        "sizes": {},
+    }
+    for n in args.sizes:
+        print(f"Building indexes over {n} vectors (dim={args.dim})...")
+        report["sizes"][str(n)] = bench_size(n, args, rng)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for n, results in report["sizes"].items():
+        print("\n" + "=" * 60)
+        print(f"N={n}")
+        print("=" * 60)
+        for index_type, entry in results.items():
+            print(f"  {index_type:<6} ({entry['type']}) build={entry['build_sec']}s  "
+                  f"{entry['bytes_per_vector']} bytes/vector")
+            for setting, stats in entry["search"].items():
+                print(f"    {setting:<12} recall@{args.k}={stats[f'recall@{args.k}']}  "
+                      f"p50={stats['latency_ms']['p50']}ms p95={stats['latency_ms']['p95']}ms")
+            if "distance_drift" in entry:
+                print(f"    distance reported/exact: {entry['distance_drift']}")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+"""
+Offline benchmark for the copilot.
+
+Runs every case in eval/test_prompts.json through graph.run_copilot against the
+local OpenAI stand-in (eval/fake_openai.py) and reports per-agent p50/p95
+latency, end-to-end throughput at N concurrent runs, retrieval recall against
+expected_sources, and writes everything to a JSON file that can be diffed
+between commits.
+
+    python eval/benchmark.py --concurrency 1 4 8 --output eval/results/benchmark.json
+"""
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from fake_openai import FakeOpenAIServer
+
+PROMPTS_PATH = os.path.join(ROOT, "eval", "test_prompts.json")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0-100) of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100.0 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50": round(percentile(values, 50), 4) if values else None,
+        "p95": round(percentile(values, 95), 4) if values else None,
+        "mean": round(sum(values) / len(values), 4) if values else None,
+    }
+
+
+def configure_environment(fake, workdir, llm_cache=False, response_cache=False, query_cache=False):
+    """Point the app at the fake API and isolate its index and caches under workdir."""
+    os.environ["OPENAI_BASE_URL"] = fake.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-fake-benchmark"
+    os.environ.setdefault("EMBEDDING_MODEL", "fake-embedding")
+    os.environ["INDEX_DIR"] = os.path.join(workdir, "index")
+    os.environ["EMBED_CACHE_PATH"] = os.path.join(workdir, "embeddings.sqlite")
+    os.environ["LLM_CACHE_PATH"] = os.path.join(workdir, "llm.sqlite")
+    os.environ["RESPONSE_CACHE_PATH"] = os.path.join(workdir, "responses.sqlite")
+    os.environ["TRACE_PATH"] = os.path.join(workdir, "traces.jsonl")
+    os.environ["LLM_CACHE"] = "1" if llm_cache else "0"
+    os.environ["RESPONSE_CACHE"] = "1" if response_cache else "0"
+    if not query_cache:
+        os.environ["QUERY_CACHE_SIZE"] = "0"
+
+
+def retrieved_docs(trace_log):
+    """Document names cited by the Research step of a run."""
+    for entry in trace_log:
+        if entry["agent"] == "Research" and isinstance(entry["output"], list):
+            return sorted({note.get("doc_name") for note in entry["output"]
+                           if isinstance(note, dict) and note.get("doc_name")})
+    return []
+
+
+def run_case(run_copilot, case):
+    start = time.perf_counter()
+    deliverable, trace_log, obs_table = run_copilot(case["task"])
+    elapsed = time.perf_counter() - start
+    docs = retrieved_docs(trace_log)
+    expected = case.get("expected_sources", [])
+    found = [doc for doc in expected if doc in docs]
+    return {
+        "id": case["id"],
+        "latency_sec": elapsed,
+        "obs_table": obs_table,
+        "retrieved_docs": docs,
+        "gated": any(obs["agent"] == "Gate" for obs in obs_table),
+        "recall": len(found) / len(expected) if expected else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline copilot benchmark against a local OpenAI stand-in")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--repeat", type=int, default=1, help="passes over the test cases per concurrency level")
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--prompt-latency", type=float, default=0.0002, help="seconds per prompt token")
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--llm-cache", action="store_true", help="keep the LLM prompt cache enabled")
+    parser.add_argument("--response-cache", action="store_true", help="keep the semantic response cache enabled")
+    parser.add_argument("--query-cache", action="store_true", help="keep the retrieval query cache enabled")
+    parser.add_argument("--workdir", default=os.path.join(ROOT, ".cache", "benchmark"))
+    parser.add_argument("--output", default=os.path.join(ROOT, "eval", "results", "benchmark.json"))
+    args = parser.parse_args()
+
+    with open(PROMPTS_PATH, "r", encoding="utf-8") as f:
+        cases = json.load(f)["test_cases"]
+
+    fake = FakeOpenAIServer(chat_latency=args.chat_latency, prompt_latency=args.prompt_latency,
+                            token_latency=args.token_latency, embed_latency=args.embed_latency,
+                            jitter=args.jitter, seed=args.seed).start()
+    configure_environment(fake, args.workdir, llm_cache=args.llm_cache, response_cache=args.response_cache,
+                          query_cache=args.query_cache)
+
+    try:
+        start = time.perf_counter()
+        from graph import run_copilot
+        from agents import structured
+        from retrieval import reranker
+        import tracing
+        if os.path.exists(tracing.TRACE_PATH):
+            os.remove(tracing.TRACE_PATH)  # span percentiles cover this benchmark's runs only
+        from retrieval.vector_store import get_store
+        import_sec = time.perf_counter() - start
+        get_store()  # builds or loads the benchmark index
+        startup_sec = time.perf_counter() - start
+
+        #Warm-up pass: one sequential run per case gives per-agent latency and recall
+        runs = [run_case(run_copilot, case) for case in cases]
+
+        throughput = {}
+        for concurrency in args.concurrency:
+            batch = [case for _ in range(args.repeat) for case in cases]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(lambda case: run_case(run_copilot, case), batch))
+            wall = time.perf_counter() - start
+            throughput[str(concurrency)] = {
+                "runs": len(results),
+                "wall_sec": round(wall, 3),
+                "runs_per_sec": round(len(results) / wall, 3),
+                "end_to_end": summarize([r["latency_sec"] for r in results]),
+            }
+            runs.extend(results)
+    finally:
+        fake.stop()
+
+    per_agent = {}
+    for run in runs:
+        for obs in run["obs_table"]:
+            per_agent.setdefault(obs["agent"], []).append(obs["latency_sec"])
+    recalls = [run["recall"] for run in runs[:len(cases)] if run["recall"] is not None]
+    rerank_ms = [obs["rerank_ms_per_query"] for run in runs for obs in run["obs_table"] if "rerank_ms_per_query" in obs]
+
+    report = {
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+        "import_sec": round(import_sec, 3),
+        "startup_sec": round(startup_sec, 3),
+        "per_agent_latency_sec": {agent: summarize(values) for agent, values in per_agent.items()},
+        "end_to_end_latency_sec": summarize([run["latency_sec"] for run in runs]),
+        "throughput": throughput,
+        "retrieval_recall": {
+            "mean": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            "per_case": {str(run["id"]): {"recall": run["recall"], "retrieved_docs": run["retrieved_docs"]}
+                         for run in runs[:len(cases)]},
+        },
+        "gated_cases": [run["id"] for run in runs[:len(cases)] if run["gated"]],
+        "fake_api_calls": fake.stats,
+        "structured_output": dict(structured.stats),
+        "rerank_ms_per_query": summarize(rerank_ms),
+        "query_cache": dict(reranker.cache_stats),
+        "span_latency_ms": tracing.span_percentiles(tracing.load_traces(limit=100000)),
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print("\n" + "=" * 60)
+    print("PER-AGENT LATENCY (sec)")
+    print("=" * 60)
+    for agent, stats in report["per_agent_latency_sec"].items():
+        print(f"  {agent:<10} p50={stats['p50']}  p95={stats['p95']}  (n={stats['n']})")
+    print("\n" + "=" * 60)
+    print("THROUGHPUT")
+    print("=" * 60)
+    for concurrency, stats in throughput.items():
+        print(f"  concurrency={concurrency:<3} {stats['runs_per_sec']} runs/s  "
+              f"e2e p50={stats['end_to_end']['p50']}s p95={stats['end_to_end']['p95']}s")
+    print("\n" + "=" * 60)
+    print(f"RETRIEVAL RECALL: {report['retrieval_recall']['mean']}")
+    print("=" * 60)
+    print(f"  gated off-topic cases (no LLM call): {report['gated_cases']}")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
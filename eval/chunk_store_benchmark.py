@@ -0,0 +1,168 @@
+"""
+Chunk store memory benchmark.
+
+Writes a synthetic corpus of --chunks chunks both in the previous layout (one JSON
+line per chunk, loaded into a dict of chunk dicts) and as a retrieval/chunk_store.py
+ChunkStore, then loads each in a fresh interpreter and reports load time, resident
+memory per chunk (RSS growth, after loading and after --lookups random search-hit
+lookups) and the latency of materializing a k=30 candidate list. Anonymous
+memory (heap) is reported separately: memory-mapped pages are file-backed page
+cache that the kernel can drop.
+
+    python eval/chunk_store_benchmark.py --chunks 200000 --output eval/results/chunk_store.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from retrieval.chunk_store import ChunkStore
+from benchmark import percentile, git_commit
+
+LEGACY_FILE = "chunks.jsonl"
+VARIANTS = {
+    "dict": "dict of chunk dicts from chunks.jsonl (previous layout)",
+    "columnar": "ChunkStore read into memory (as while updating the index)",
+    "columnar_mmap": "ChunkStore memory-mapped (as served)",
+}
+
+
+def rss_bytes():
+    """(total, anonymous) resident bytes. File-backed pages of a mapping are shared page cache the kernel can drop."""
+    status = {}
+    with open("/proc/self/status", "r", encoding="utf-8") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            status[key] = value
+    return tuple(int(status.get(key, "0 kB").split()[0]) * 1024 for key in ("VmRSS", "RssAnon"))
+
+
+def synthetic_chunks(n, chars, seed):
+    """Chunks of pseudo-words shaped like the corpus: 20 documents, ~40 sections each, 3 chunks per page."""
+    rng = np.random.default_rng(seed)
+    vocabulary = ["".join(rng.choice(list("abcdefghijklmnopqrstuvwxyz"), rng.integers(3, 11))) for _ in range(5000)]
+    words_per_chunk = chars // 7
+    for number in range(n):
+        words = [vocabulary[i] for i in rng.integers(0, len(vocabulary), words_per_chunk)]
+        yield {
+            "chunk_id": f"Document {number % 20}.pdf__chunk_{number // 20}",
+            "number": number // 20,
+            "doc_name": f"Document {number % 20}.pdf",
+            "page": number // 60 + 1,
+            "section": f"Section {number // 20 % 40}",
+            "tokens": len(words) * 3 // 2,
+            "text": " ".join(words) + ".",
+        }
+
+
+def write_corpus(directory, n, chars, seed):
+    store = ChunkStore()
+    with open(os.path.join(directory, LEGACY_FILE), "w", encoding="utf-8") as f:
+        for row_id, chunk in enumerate(synthetic_chunks(n, chars, seed)):
+            f.write(json.dumps({"chunk_id": chunk["chunk_id"], "doc_name": chunk["doc_name"], "page": chunk["page"],
+                                "text": chunk["text"], "row_id": row_id}) + "\n")
+            store.extend([row_id], [chunk])
+    store.save(directory)
+
+
+def load(variant, directory):
+    if variant == "dict":
+        chunks = {}
+        with open(os.path.join(directory, LEGACY_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                chunks[chunk["row_id"]] = chunk
+        return chunks
+    return ChunkStore.load(directory, mmap_files=variant == "columnar_mmap")
+
+
+def measure(variant, directory, lookups, seed):
+    """Runs in a fresh interpreter so RSS growth is attributable to the variant."""
+    before = rss_bytes()
+    start = time.perf_counter()
+    chunks = load(variant, directory)
+    load_sec = time.perf_counter() - start
+    loaded = rss_bytes()
+    n = len(chunks)
+
+    def per_chunk(now):
+        return {"rss": round((now[0] - before[0]) / n, 1), "anonymous": round((now[1] - before[1]) / n, 1)}
+
+    rng = random.Random(seed)
+    latencies = []
+    for _ in range(max(1, lookups // 30)):
+        hits = [rng.randrange(n) for _ in range(30)]
+        start = time.perf_counter()
+        results = [{"text": chunk["text"], "citation": chunk["chunk_id"]} for chunk in (chunks[row] for row in hits)]
+        latencies.append((time.perf_counter() - start) * 1e6)
+    assert all(r["text"] for r in results)
+    return {
+        "chunks": n,
+        "load_sec": round(load_sec, 3),
+        "bytes_per_chunk_loaded": per_chunk(loaded),
+        "bytes_per_chunk_after_lookups": per_chunk(rss_bytes()),
+        "lookup_30_hits_us": {"p50": round(percentile(latencies, 50), 1), "p95": round(percentile(latencies, 95), 1)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident memory per chunk: dict of dicts vs columnar ChunkStore")
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--chars", type=int, default=800, help="characters per chunk (~200 tokens)")
+    parser.add_argument("--lookups", type=int, default=3000, help="random row-id lookups after loading")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=os.path.join(ROOT, "eval", "results", "chunk_store.json"))
+    parser.add_argument("--measure", choices=list(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument("--dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.dir, args.lookups, args.seed)))
+        return
+
+    directory = tempfile.mkdtemp(prefix="chunk_store_")
+    try:
+        print(f"Writing {args.chunks} synthetic chunks of ~{args.chars} characters...")
+        write_corpus(directory, args.chunks, args.chars, args.seed)
+        report = {
+            "git_commit": git_commit(),
+            "config": {k: v for k, v in vars(args).items() if k not in ("output", "measure", "dir")},
+            "file_bytes": {name: os.path.getsize(os.path.join(directory, name)) for name in sorted(os.listdir(directory))},
+            "variants": {},
+        }
+        for variant in VARIANTS:
+            output = subprocess.run([sys.executable, __file__, "--measure", variant, "--dir", directory,
+                                     "--lookups", str(args.lookups), "--seed", str(args.seed)],
+                                    check=True, capture_output=True, text=True).stdout
+            report["variants"][variant] = json.loads(output.strip().splitlines()[-1])
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print("\n" + "=" * 60)
+    print(f"CHUNK STORE: {args.chunks} chunks")
+    print("=" * 60)
+    for variant, stats in report["variants"].items():
+        loaded, used = stats["bytes_per_chunk_loaded"], stats["bytes_per_chunk_after_lookups"]
+        print(f"  {variant:<14} {VARIANTS[variant]}")
+        print(f"    load={stats['load_sec']}s  bytes/chunk loaded: rss={loaded['rss']} anon={loaded['anonymous']}  "
+              f"after lookups: rss={used['rss']} anon={used['anonymous']}  "
+              f"30 hits p50={stats['lookup_30_hits_us']['p50']}us")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Local OpenAI stand-in for offline benchmarks and load tests.
+
+Serves the two endpoints the copilot uses - /v1/chat/completions (including
+stream=True server-sent events) and /v1/embeddings - with deterministic canned
+responses and configurable injected latency. Point the app at it by setting
+OPENAI_BASE_URL to the server's base_url; no application code is patched.
+"""
+import re
+import json
+import math
+import time
+import random
+import hashlib
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+EMBEDDING_DIM = 256
+# Shared component on dimension 0. Real embedding models are anisotropic (unrelated
+# texts still have cosine ~0.7), and the Research L2 threshold is calibrated for that.
+ANISOTROPY = 1.5
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+SUMMARY_WORDS = 80
+STOPWORDS = {"a", "an", "and", "are", "for", "how", "in", "is", "of", "on", "the", "to", "we", "what", "with"}
+
+
+def fake_embedding(text, dim=EMBEDDING_DIM):
+    """Deterministic hashed bag-of-words vector (unit length), so similar texts land close together."""
+    bag = [0.0] * dim
+    items = text if isinstance(text, list) else [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+    for item in items:
+        digest = hashlib.md5(str(item).encode("utf-8")).digest()
+        bag[1 + int.from_bytes(digest[:4], "little") % (dim - 1)] += 1.0
+    norm = math.sqrt(sum(x * x for x in bag)) or 1.0
+    vector = [x / norm for x in bag]
+    vector[0] = ANISOTROPY
+    norm = math.sqrt(1.0 + ANISOTROPY ** 2) if items else ANISOTROPY
+    return [x / norm for x in vector]
+
+
+def _section(prompt, start, end=None):
+    i = prompt.find(start)
+    if i < 0:
+        return ""
+    i += len(start)
+    j = prompt.find(end, i) if end else -1
+    return prompt[i:j if j >= 0 else len(prompt)].strip()
+
+
+def _planner_reply(prompt):
+    task = _section(prompt, "User Task:", "\n")
+    topics = [t.strip(" .?") for t in re.split(r",| and | with ", task) if len(t.strip(" .?")) > 12][:3] or [task]
+    subtasks = [{"step": i + 1, "task": f"Research {topic}", "agent": "Research", "priority": "High"}
+                for i, topic in enumerate(topics)]
+    subtasks.append({"step": len(subtasks) + 1, "task": "Draft the deliverable", "agent": "Writer", "priority": "High"})
+    subtasks.append({"step": len(subtasks) + 1, "task": "Verify claims", "agent": "Verifier", "priority": "High"})
+    return json.dumps({
+        "overall_goal": task,
+        "subtasks": subtasks,
+        "dependencies": ["Research must complete before Writer starts"],
+        "success_criteria": ["All claims cite retrieved chunks"],
+    }, indent=2)
+
+
+def _writer_reply(prompt):
+    citations = re.findall(r"Citation:\s*(\S[^\n]*)", prompt)
+    notes = _section(prompt, "Research Notes:", "Generate a JSON response")
+    #Fixed length, like a model following the prompt's length instruction, so reply size does not
+    #depend on how the notes are formatted
+    words = [w for w in re.sub(r"Citation:[^\n]*", " ", notes).split() if w != "-"]
+    summary = " ".join(words[:SUMMARY_WORDS]) or "The research notes do not contain enough detail for a summary."
+    draft = {
+        "executive_summary": summary,
+        "client_email": f"Dear Client,\n\nOur review of the sources found the following:\n\n{summary}\n\n"
+                        "Recommendations:\n- Review the cited practices\n- Assign owners for each action\n\n"
+                        "Kind Regards,\nSupply Chain Analysis Team",
+        "action_list": [
+            {"owner": "Operations", "due_date": "2026-03-01", "confidence": "High", "description": "Review the cited practices"},
+            {"owner": "Procurement", "due_date": "2026-04-01", "confidence": "Medium", "description": "Assign owners for each action"},
+        ],
+        "sources_cited": sorted(set(c.strip() for c in citations)),
+    }
+    #Section prompts ask for a subset of the fields
+    fields = _section(prompt, "Generate a JSON response", "Ensure all claims")
+    draft = {field: value for field, value in draft.items() if f'"{field}":' in fields}
+    return "```json\n" + json.dumps(draft, indent=2) + "\n```"
+
+
+def _verifier_reply(prompt):
+    claims = _section(prompt, "CLAIMS TO VERIFY:", "Instructions:")
+    if claims:
+        ids = re.findall(r"^\s*(\d+)\.", claims, flags=re.MULTILINE)
+        return "```json\n" + json.dumps({"verdicts": [{"id": int(i), "verdict": "SUPPORTED"} for i in ids]}) + "\n```"
+    draft = _section(prompt, "DRAFT TO VERIFY:", "Instructions:")
+    return "```json\n" + draft + "\n```"
+
+
+def canned_reply(prompt):
+    """Deterministic reply for a copilot agent prompt."""
+    if "Planner Agent" in prompt:
+        return _planner_reply(prompt)
+    if "Writer Agent" in prompt:
+        return _writer_reply(prompt)
+    if "Verifier Agent" in prompt:
+        return _verifier_reply(prompt)
+    return "OK"
+
+
+class FakeOpenAIServer:
+    """
+    Threaded HTTP server with OpenAI-compatible chat and embedding endpoints.
+    Latency per chat call is chat_latency + prompt_latency * prompt tokens +
+    token_latency * completion tokens, per embedding call embed_latency, each
+    scaled by a seeded +/- jitter.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, chat_latency=0.5, token_latency=0.002,
+                 embed_latency=0.05, jitter=0.1, seed=0, prompt_latency=0.0002):
+        self.chat_latency = chat_latency
+        self.prompt_latency = prompt_latency
+        self.token_latency = token_latency
+        self.embed_latency = embed_latency
+        self.jitter = jitter
+        self.random = random.Random(seed)
+        self.stats = {"chat_calls": 0, "embedding_calls": 0, "embedded_texts": 0,
+                      "prompt_tokens": 0, "completion_tokens": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def _delay(self, seconds):
+        with self._lock:
+            factor = 1 + self.random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(0.0, seconds * factor))
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _json(self, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if self.path.endswith("/chat/completions"):
+                    self._chat(request)
+                elif self.path.endswith("/embeddings"):
+                    self._embeddings(request)
+                else:
+                    self.send_error(404)
+
+            def _embeddings(self, request):
+                inputs = request.get("input", [])
+                if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+                    inputs = [inputs]
+                with server._lock:
+                    server.stats["embedding_calls"] += 1
+                    server.stats["embedded_texts"] += len(inputs)
+                server._delay(server.embed_latency)
+                self._json({
+                    "object": "list",
+                    "model": request.get("model", "fake-embedding"),
+                    "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(text)}
+                             for i, text in enumerate(inputs)],
+                    "usage": {"prompt_tokens": 0, "total_tokens": 0},
+                })
+
+            def _chat(self, request):
+                prompt = "\n".join(str(m.get("content", "")) for m in request.get("messages", []))
+                reply = canned_reply(prompt)
+                if request.get("response_format", {}).get("type") in ("json_object", "json_schema"):
+                    reply = re.sub(r"^```(json)?\n|\n```$", "", reply)  # structured outputs are bare JSON
+                prompt_tokens = max(1, len(prompt) // 4)
+                completion_tokens = max(1, len(reply) // 4)
+                usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                         "total_tokens": prompt_tokens + completion_tokens}
+                with server._lock:
+                    server.stats["chat_calls"] += 1
+                    server.stats["prompt_tokens"] += prompt_tokens
+                    server.stats["completion_tokens"] += completion_tokens
+                prefill = server.chat_latency + server.prompt_latency * prompt_tokens
+                base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": request.get("model", "fake")}
+
+                if not request.get("stream"):
+                    server._delay(prefill + server.token_latency * completion_tokens)
+                    self._json(dict(base, object="chat.completion", usage=usage, choices=[{
+                        "index": 0, "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": reply},
+                    }]))
+                    return
+
+                #Server-sent events: first token after the prefill delay, then token_latency per ~4 chars
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                server._delay(prefill)
+                pieces = [reply[i:i + 16] for i in range(0, len(reply), 16)]
+                for piece in pieces:
+                    chunk = dict(base, object="chat.completion.chunk", choices=[{
+                        "index": 0, "finish_reason": None, "delta": {"content": piece},
+                    }])
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    server._delay(server.token_latency * 4)
+                final = dict(base, object="chat.completion.chunk", choices=[{
+                    "index": 0, "finish_reason": "stop", "delta": {},
+                }], usage=usage)
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the local OpenAI stand-in")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--prompt-latency", type=float, default=0.0002, help="seconds per prompt token")
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    fake = FakeOpenAIServer(port=args.port, chat_latency=args.chat_latency, prompt_latency=args.prompt_latency,
+                            token_latency=args.token_latency, embed_latency=args.embed_latency)
+    print(f"Fake OpenAI API listening on {fake.base_url} (set OPENAI_BASE_URL to this)")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
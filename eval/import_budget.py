@@ -0,0 +1,91 @@
+"""
+Import-time budget check.
+
+Imports `graph` in a fresh interpreter and fails (exit code 1) if it takes longer
+than the budget or if anything opens a network connection or loads the index
+during import. Startup work belongs behind the lazy getters
+(retrieval.vector_store.get_store, agents.llm.get_client).
+
+    python eval/import_budget.py --budget-ms 500
+"""
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "500"))
+
+#Runs in the child interpreter: block sockets, time the import, report what happened
+PROBE = r"""
+import sys, json, time, socket
+
+connections = []
+def blocked_connect(self, address):
+    connections.append(str(address))
+    raise OSError("network access during import")
+socket.socket.connect = blocked_connect
+socket.create_connection = lambda address, *a, **kw: blocked_connect(None, address)
+
+start = time.perf_counter()
+import graph
+elapsed_ms = (time.perf_counter() - start) * 1000
+
+import retrieval.vector_store as vector_store
+import agents.llm as llm
+print(json.dumps({
+    "import_ms": round(elapsed_ms, 1),
+    "connections": connections,
+    "index_loaded": bool(vector_store._shards.shards),
+    "embeddings_created": vector_store._embeddings is not None,
+    "llm_client_created": llm._client is not None,
+    "heavy_modules": sorted(m for m in ("openai", "langchain_core", "langchain_openai", "langchain_text_splitters", "PyPDF2")
+                            if m in sys.modules),
+}))
+"""
+
+
+def measure(repeat=3):
+    """Best-of-N cold import of graph in a child interpreter (the first run also warms .pyc files)."""
+    results = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, capture_output=True, text=True,
+                             env=dict(os.environ, PYTHONPATH=ROOT))
+        if out.returncode != 0:
+            raise RuntimeError(f"import graph failed:\n{out.stderr}")
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(results, key=lambda r: r["import_ms"])
+    best["connections"] = sorted({c for r in results for c in r["connections"]})
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that `import graph` is fast and does no I/O")
+    parser.add_argument("--budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    result = measure(args.repeat)
+    print(json.dumps(result, indent=2))
+
+    failures = []
+    if result["import_ms"] > args.budget_ms:
+        failures.append(f"import took {result['import_ms']}ms (budget {args.budget_ms}ms)")
+    if result["connections"]:
+        failures.append(f"network connections during import: {result['connections']}")
+    for flag in ("index_loaded", "embeddings_created", "llm_client_created"):
+        if result[flag]:
+            failures.append(f"{flag} at import time")
+    if result["heavy_modules"]:
+        failures.append(f"imported eagerly: {', '.join(result['heavy_modules'])}")
+
+    for failure in failures:
+        print(f"⚠ {failure}")
+    if failures:
+        sys.exit(1)
+    print(f"✓ import graph: {result['import_ms']}ms (budget {args.budget_ms}ms), no network, nothing loaded")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Load test for the HTTP service (service.py) against the local OpenAI stand-in.
+
+Starts eval/fake_openai.py and the service in a subprocess, fires --requests
+POST /run calls with --concurrency clients (tasks drawn from
+eval/test_prompts.json, so identical tasks overlap and get coalesced), follows
+one job over server-sent events, and reports throughput, latency percentiles,
+coalescing and errors as JSON.
+
+    python eval/load_test.py --requests 200 --concurrency 64 --workers 16 --chat-latency 0.5
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+
+from fake_openai import FakeOpenAIServer
+from benchmark import configure_environment, summarize, git_commit, PROMPTS_PATH
+
+
+def start_service(port, workers, timeout=300):
+    """Run service.py with the benchmark environment and wait until /health answers."""
+    process = subprocess.Popen([sys.executable, os.path.join(ROOT, "service.py"), "--port", str(port),
+                                "--workers", str(workers)], cwd=ROOT, env=dict(os.environ))
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service exited with code {process.returncode}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError("service did not become ready")
+
+
+async def follow_events(client, base_url, task):
+    """Submit a job and count the server-sent event types until it finishes."""
+    job = (await client.post(f"{base_url}/jobs", json={"task": task})).json()
+    counts = {}
+    async with client.stream("GET", f"{base_url}{job['events_url']}", params={"tokens": "true"}) as response:
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event_type = line[len("event: "):]
+                counts[event_type] = counts.get(event_type, 0) + 1
+    return counts
+
+
+async def run_load(base_url, tasks, concurrency):
+    limits = httpx.Limits(max_connections=concurrency + 4, max_keepalive_connections=concurrency + 4)
+    async with httpx.AsyncClient(timeout=600, limits=limits) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(task):
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    response = await client.post(f"{base_url}/run", json={"task": task})
+                    body = response.json()
+                    return {"status": response.status_code, "latency_sec": time.perf_counter() - start,
+                            "coalesced": body.get("coalesced", False), "queue_sec": body.get("queue_sec")}
+                except httpx.HTTPError as e:
+                    return {"status": None, "latency_sec": time.perf_counter() - start, "error": str(e)}
+
+        start = time.perf_counter()
+        sse = asyncio.create_task(follow_events(client, base_url, tasks[0]))
+        results = await asyncio.gather(*(one(task) for task in tasks))
+        wall = time.perf_counter() - start
+        events = await sse
+        health = (await client.get(f"{base_url}/health")).json()
+    return results, wall, events, health
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the copilot HTTP service against a fake LLM")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=64, help="concurrent HTTP clients")
+    parser.add_argument("--workers", type=int, default=16, help="service workers (copilot runs in flight)")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--chat-latency", type=float, default=0.5)
+    parser.add_argument("--prompt-latency", type=float, default=0.0002)
+    parser.add_argument("--token-latency", type=float, default=0.002)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", default=os.path.join(ROOT, ".cache", "benchmark"))
+    parser.add_argument("--output", default=os.path.join(ROOT, "eval", "results", "load_test.json"))
+    args = parser.parse_args()
+
+    with open(PROMPTS_PATH, "r", encoding="utf-8") as f:
+        prompts = [case["task"] for case in json.load(f)["test_cases"]]
+    rng = random.Random(args.seed)
+    tasks = [rng.choice(prompts) for _ in range(args.requests)]
+
+    fake = FakeOpenAIServer(chat_latency=args.chat_latency, prompt_latency=args.prompt_latency,
+                            token_latency=args.token_latency, embed_latency=args.embed_latency,
+                            seed=args.seed).start()
+    configure_environment(fake, args.workdir)
+    os.environ["LLM_MAX_CONNECTIONS"] = str(max(20, 2 * args.workers))
+    service = start_service(args.port, args.workers)
+    try:
+        results, wall, events, health = asyncio.run(run_load(f"http://127.0.0.1:{args.port}", tasks, args.concurrency))
+    finally:
+        service.terminate()
+        service.wait(timeout=30)
+        fake.stop()
+
+    ok = [r for r in results if r["status"] == 200]
+    report = {
+        "git_commit": git_commit(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "workdir")},
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": len(results) - len(ok),
+        "wall_sec": round(wall, 3),
+        "requests_per_sec": round(len(results) / wall, 3),
+        "latency_sec": summarize([r["latency_sec"] for r in ok]),
+        "queue_sec": summarize([r["queue_sec"] for r in ok if r.get("queue_sec") is not None]),
+        "coalesced_requests": sum(1 for r in ok if r["coalesced"]),
+        "sse_events": events,
+        "service": health,
+        "fake_api_calls": fake.stats,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    print("\n" + "=" * 60)
+    print(f"LOAD TEST: {args.requests} requests, {args.concurrency} clients, {args.workers} workers")
+    print("=" * 60)
+    print(f"  {report['requests_per_sec']} req/s over {report['wall_sec']}s, {report['errors']} errors")
+    print(f"  latency p50={report['latency_sec']['p50']}s p95={report['latency_sec']['p95']}s  "
+          f"queue p50={report['queue_sec']['p50']}s p95={report['queue_sec']['p95']}s")
+    print(f"  coalesced {report['coalesced_requests']} requests into in-flight jobs; "
+          f"{health['jobs']['completed']} copilot runs, {fake.stats['chat_calls']} LLM calls")
+    print(f"  SSE events for one job: {events}")
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
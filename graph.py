@@ -1,88 +1,211 @@
 from agents.planner_agent import planner_agent
-from agents.research_agent import research_agent
-from agents.writer_agent import writer_agent
+from agents.research_agent import research_agent, retrieve_task, domain_gate
+from agents.writer_agent import writer_agent, not_found_draft, SECTIONS
 from agents.verifier_agent import verifier_agent
+from agents.structured import partial_json_string
+import semantic_cache
+import tracing
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import threading
+import queue
 import time
 import json
 
-def run_copilot(user_task):
+def run_steps(steps, max_workers=None, run_start=None, on_event=None):
     """
-    Main orchestration function for the multi-agent copilot.
-    Returns structured output with all required components.
+    Run agent steps as a small dependency graph on a thread pool.
+    Each step is a dict with "agent", "deps" (names of steps it needs) and
+    "run" (callable taking the dict of finished outputs); a step starts as soon
+    as all of its deps have finished. Returns (outputs, timings) where timings
+    maps each step to (start_sec, end_sec) relative to run_start (perf_counter
+    value, defaults to now). on_event, if given, receives agent_start/agent_end
+    events from the worker threads. Each step runs in an "agent" span of the
+    current trace, which records how long it queued after its deps were done.
     """
-    trace_log = []
-    obs_table = []
+    run_start = time.perf_counter() if run_start is None else run_start
+    pending = {step["agent"]: step for step in steps}
+    outputs, timings, running = {}, {}, {}
 
-    #Step 1: Planner Decompose the task
-    start = time.time()
-    plan = planner_agent(user_task)
-    planner_latency = time.time() - start
-    trace_log.append({
-        "agent": "Planner",
-        "task": user_task,
-        "output": plan,
-        "latency_sec": planner_latency
-    })
-    obs_table.append({"agent": "Planner", "latency_sec": round(planner_latency, 2)})
+    def run_step(step, ready):
+        start = time.perf_counter() - run_start
+        if on_event:
+            on_event({"type": "agent_start", "agent": step["agent"], "t": start})
+        with tracing.span(f"agent.{step['agent']}", agent=step["agent"],
+                          queue_ms=round((start - ready) * 1000, 3)):
+            output = step["run"](outputs)
+        end = time.perf_counter() - run_start
+        if on_event:
+            on_event({"type": "agent_end", "agent": step["agent"], "t": end, "latency_sec": end - start})
+        return output, start, end
 
-    #Step 2: Research Retrieve grounded notes with citations
-    start = time.time()
-    notes = research_agent(user_task)  # Returns list of dicts with citations
-    research_latency = time.time() - start
-    trace_log.append({
-        "agent": "Research",
-        "task": plan,
-        "output": notes,
-        "latency_sec": research_latency
-    })
-    obs_table.append({"agent": "Research", "latency_sec": round(research_latency, 2)})
+    with ThreadPoolExecutor(max_workers=max_workers or len(steps)) as pool:
+        while pending or running:
+            for name, step in list(pending.items()):
+                if all(dep in outputs for dep in step["deps"]):
+                    ready = time.perf_counter() - run_start
+                    running[pool.submit(tracing.in_context(run_step), step, ready)] = name
+                    del pending[name]
+            if not running:
+                raise ValueError(f"Unsatisfiable step dependencies: {sorted(pending)}")
 
-    #Step 3: Writer Produce structured deliverable (JSON)
-    start = time.time()
-    draft = writer_agent(notes)  #Returns dict with executive_summary, email, action_list
-    writer_latency = time.time() - start
-    trace_log.append({
-        "agent": "Writer",
-        "task": "Generate deliverable from research",
-        "output": draft,
-        "latency_sec": writer_latency
-    })
-    obs_table.append({"agent": "Writer", "latency_sec": round(writer_latency, 2)})
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                output, start, end = future.result()
+                outputs[name] = output
+                timings[name] = (start, end)
+
+    return outputs, timings
 
-    #Step 4: Verifier Check for hallucinations and unsupported claims
-    start = time.time()
-    verified = verifier_agent(draft, notes)
-    verifier_latency = time.time() - start
+
+def _record(trace_log, obs_table, agent, task, output, start, end, **extra):
+    """Append one step to the trace log and observability table."""
     trace_log.append({
-        "agent": "Verifier",
-        "task": "Verify claims against sources",
-        "output": verified,
-        "latency_sec": verifier_latency
+        "agent": agent,
+        "task": task,
+        "output": output,
+        "latency_sec": end - start,
+        "start_sec": start,
+        "end_sec": end,
+        **extra
+    })
+    obs_table.append({
+        "agent": agent,
+        "latency_sec": round(end - start, 2),
+        "start_sec": round(start, 2),
+        "end_sec": round(end, 2),
+        **extra
     })
-    obs_table.append({"agent": "Verifier", "latency_sec": round(verifier_latency, 2)})
 
-    #Extract structured elements from verified output
+
+def run_copilot(user_task, use_cache=True, on_event=None, trace_out=None, collections=None):
+    """
+    Main orchestration function for the multi-agent copilot (flow: see README).
+    Returns (deliverable, trace_log, obs_table). use_cache enables the semantic
+    response cache; on_event, if given, receives progress events (agent_start,
+    token, agent_end) as they happen; if trace_out is a dict, the finished trace is
+    written to it. collections names the document collections to answer from
+    (default: all of them).
+    """
+    with tracing.trace("run_copilot", task=user_task, collections=collections) as root:
+        deliverable, trace_log, obs_table = _run_copilot(user_task, use_cache, on_event, collections)
+        root.set(cache_hit=any(obs.get("cache_hit") for obs in obs_table))
+    if trace_out is not None and root is not tracing.NO_SPAN:
+        trace_out.update(root.trace.to_dict())
+    return deliverable, trace_log, obs_table
+
+
+def _run_copilot(user_task, use_cache, on_event, collections):
+    trace_log = []
+    obs_table = []
+    run_start = time.perf_counter()
+    started, ttft = {}, {}
+    #Per-agent stats: token counts and parse failures of the LLM agents, rerank latency of the retrieval steps
+    agent_stats = {"Retrieval": {}, "Planner": {}, "Research": {}}
+    for name in SECTIONS:
+        agent_stats[f"Writer ({name})"] = {}
+        agent_stats[f"Verifier ({name})"] = {}
+
+    def emit(event):
+        if event["type"] == "agent_start":
+            started[event["agent"]] = event["t"]
+        on_event(event)
+
+    def tokens(agent):
+        """Token callback for a streaming agent, or None when not streaming."""
+        if on_event is None:
+            return None
+
+        def on_token(delta):
+            now = time.perf_counter() - run_start
+            if agent not in ttft:
+                ttft[agent] = now - started.get(agent, now)
+            on_event({"type": "token", "agent": agent, "delta": delta, "t": now})
+        return on_token
+
+    #Gate Reject out-of-domain tasks (or an empty index) before paying for any LLM call
+    with tracing.span("gate") as span:
+        off_topic = domain_gate(user_task, collections)
+        span.set(passed=off_topic is None)
+    if off_topic is not None:
+        end = time.perf_counter() - run_start
+        _record(trace_log, obs_table, "Gate", user_task, [off_topic], 0.0, end, gate_passed=False)
+        return {**not_found_draft(), "sources": [], "claims": []}, trace_log, obs_table
+
+    #Cache Look up a deliverable for a similar task backed by the same chunks
+    task_results = None
+    chunk_ids = []
+    if use_cache and semantic_cache.RESPONSE_CACHE_ENABLED:
+        with tracing.span("cache.lookup"):
+            task_results = retrieve_task(user_task, stats=agent_stats["Retrieval"], collections=collections)
+            chunk_ids = semantic_cache.signature(task_results)
+            cached = semantic_cache.lookup(user_task, chunk_ids, collections)
+        end = time.perf_counter() - run_start
+        _record(trace_log, obs_table, "Cache", user_task,
+                {"chunk_ids": chunk_ids, "similar_task": cached and cached["task"], "similarity": cached and cached["similarity"]},
+                0.0, end, cache_hit=cached is not None, **agent_stats["Retrieval"])
+        if cached is not None:
+            return cached["deliverable"], trace_log, obs_table
+
+    steps = [
+        #Planner Decompose the task
+        {"agent": "Planner", "deps": [], "task": user_task,
+         "run": lambda out: planner_agent(user_task, stats=agent_stats["Planner"])},
+        #Research Retrieve grounded notes with citations (list of dicts) for the task and plan subtasks
+        {"agent": "Research", "deps": ["Planner"], "task": user_task,
+         "run": lambda out: research_agent(user_task, out["Planner"], out.get("Retrieval", task_results),
+                                           stats=agent_stats["Research"], collections=collections)},
+    ]
+    for name, field in SECTIONS.items():
+        writer, verifier = f"Writer ({name})", f"Verifier ({name})"
+        steps += [
+            #Writer Produce one structured section of the deliverable (JSON)
+            {"agent": writer, "deps": ["Research"], "task": f"Generate {field} from research",
+             "run": lambda out, writer=writer, field=field: writer_agent(
+                 out["Research"], on_token=tokens(writer), query=user_task, stats=agent_stats[writer], fields=[field])},
+            #Verifier Check the section for hallucinations and unsupported claims
+            {"agent": verifier, "deps": [writer, "Research"], "task": f"Verify {field} claims against sources",
+             "run": lambda out, writer=writer, verifier=verifier: verifier_agent(
+                 out[writer], out["Research"], on_token=tokens(verifier), stats=agent_stats[verifier])},
+        ]
+    if task_results is None:
+        #Retrieval Search the raw task concurrently with the Planner
+        steps.insert(1, {"agent": "Retrieval", "deps": [], "task": user_task,
+                         "run": lambda out: retrieve_task(user_task, stats=agent_stats["Retrieval"],
+                                                          collections=collections)})
+        steps[2]["deps"].append("Retrieval")
+    outputs, timings = run_steps(steps, run_start=run_start, on_event=emit if on_event else None)
+
+    llm_usage = tracing.rollup(tracing.current_trace() or {}, "agent", "llm.chat",
+                               ("prompt_tokens", "completion_tokens", "cost_usd", "queue_ms"))
+    for step in steps:
+        start, end = timings[step["agent"]]
+        extra = {"ttft_sec": round(ttft[step["agent"]], 2)} if step["agent"] in ttft else {}
+        extra.update(agent_stats.get(step["agent"], {}))
+        for key, value in llm_usage.get(step["agent"], {}).items():
+            extra[f"llm_{key}"] = round(value, 6) if isinstance(value, float) else value
+        _record(trace_log, obs_table, step["agent"], step["task"], outputs[step["agent"]], start, end, **extra)
+
+    notes = outputs["Research"]
+
+    #Merge the verified sections (unsupported claims tagged) and their per-claim verdicts
+    draft, claims, cited = {}, [], []
+    for name, field in SECTIONS.items():
+        verified = outputs[f"Verifier ({name})"]
+        if field in verified["draft"]:
+            draft[field] = verified["draft"][field]
+        cited += verified["draft"].get("sources_cited") or []
+        claims += [dict(claim, id=len(claims) + i + 1) for i, claim in enumerate(verified["claims"])]
+    draft["sources_cited"] = list(dict.fromkeys(cited))
+
     deliverable = {
         "executive_summary": "",
         "client_email": "",
         "action_list": [],
         "sources": [],
-        "verified_content": verified
+        **draft,
+        "claims": claims,
     }
-    
-    #Try to parse verified output if it contains JSON
-    try:
-        if isinstance(verified, str):
-            if "```json" in verified:
-                json_str = verified.split("```json")[1].split("```")[0].strip()
-                parsed = json.loads(json_str)
-                deliverable.update(parsed)
-            elif isinstance(draft, dict):
-                deliverable.update(draft)
-    except:
-        #If parsing fails, use draft structure if available
-        if isinstance(draft, dict):
-            deliverable.update(draft)
 
     #Extract sources from research notes
     sources_list = []
@@ -92,18 +215,67 @@ def run_copilot(user_task):
                 sources_list.append(note.get("citation"))
     deliverable["sources"] = list(set(sources_list))  #Remove duplicates
 
+    if chunk_ids:
+        semantic_cache.store(user_task, chunk_ids, deliverable, collections)
+
     return deliverable, trace_log, obs_table
 
+
+def run_copilot_stream(user_task, use_cache=True, collections=None):
+    """
+    Streaming mode: run the copilot in a background thread and yield its events
+    as they happen - agent_start/agent_end per agent, token deltas from Writer
+    and Verifier, and finally {"type": "done", "deliverable", "trace_log", "obs_table", "trace"}.
+    """
+    events = queue.Queue()
+
+    def worker():
+        try:
+            trace = {}
+            deliverable, trace_log, obs_table = run_copilot(user_task, use_cache=use_cache, on_event=events.put,
+                                                            trace_out=trace, collections=collections)
+            events.put({"type": "done", "deliverable": deliverable, "trace_log": trace_log, "obs_table": obs_table,
+                        "trace": trace})
+        except Exception as e:
+            events.put({"type": "error", "error": e})
+
+    threading.Thread(target=tracing.in_context(worker), daemon=True).start()
+    while True:
+        event = events.get()
+        if event["type"] == "error":
+            raise event["error"]
+        yield event
+        if event["type"] == "done":
+            return
+
 #Run locally / CLI mode
 if __name__ == "__main__":
     user_task = input("Enter your business task: ")
-    deliverable, trace_log, obs_table = run_copilot(user_task)
+
+    #Stream progress and the draft executive summary as it is generated
+    draft_text = ""
+    printed = 0
+    for event in run_copilot_stream(user_task):
+        if event["type"] == "agent_start":
+            print(f"→ {event['agent']} started ({event['t']:.2f}s)")
+        elif event["type"] == "agent_end":
+            if event["agent"] == "Writer (summary)" and printed:
+                print()
+            print(f"✓ {event['agent']} finished in {event['latency_sec']:.2f}s")
+        elif event["type"] == "token" and event["agent"] == "Writer (summary)":
+            draft_text += event["delta"]
+            summary = partial_json_string(draft_text, "executive_summary")
+            print(summary[printed:], end="", flush=True)
+            printed = len(summary)
+        elif event["type"] == "done":
+            deliverable, trace_log, obs_table = event["deliverable"], event["trace_log"], event["obs_table"]
+            trace = event["trace"]
 
     print("\n" + "="*60)
     print("EXECUTIVE SUMMARY")
     print("="*60)
     if isinstance(deliverable, dict):
-        print(deliverable.get("executive_summary", deliverable.get("verified_content", "")))
+        print(deliverable.get("executive_summary", ""))
     else:
         print(deliverable)
 
@@ -127,11 +299,27 @@ if __name__ == "__main__":
     for source in deliverable.get("sources", []):
         print(f"  - {source}")
 
+    flagged = [c for c in deliverable.get("claims", []) if c.get("verdict") != "SUPPORTED"]
+    print("\n" + "="*60)
+    print(f"CLAIM VERIFICATION ({len(deliverable.get('claims', [])) - len(flagged)} supported, {len(flagged)} flagged)")
+    print("="*60)
+    for claim in flagged:
+        print(f"  - [{claim.get('verdict') or 'UNVERIFIED'}] {claim['text']}")
+
     print("\n" + "="*60)
     print("OBSERVABILITY TABLE")
     print("="*60)
     for obs in obs_table:
-        print(f"  {obs['agent']}: {obs['latency_sec']}s")
+        hit = " [cache hit]" if obs.get("cache_hit") else ""
+        tokens = f" [{obs['prompt_tokens']} prompt tokens]" if "prompt_tokens" in obs else ""
+        rerank = f" [rerank {obs['rerank_ms']}ms]" if "rerank_ms" in obs else ""
+        print(f"  {obs['agent']}: {obs['latency_sec']}s ({obs['start_sec']}s → {obs['end_sec']}s){hit}{tokens}{rerank}")
+
+    print("\n" + "="*60)
+    print("SPANS")
+    print("="*60)
+    for row in tracing.waterfall(trace):
+        print(f"  {row['start_ms']:>9.1f}ms {row['duration_ms']:>9.1f}ms  {'  ' * row['depth']}{row['name']}")
 
     print("\n" + "="*60)
     print("FULL TRACE LOG")
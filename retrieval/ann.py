@@ -0,0 +1,116 @@
+# retrieval/ann.py
+import os
+import math
+
+import numpy as np
+import faiss
+
+# Index backend: "flat" (exact), "ivfpq" (inverted lists + product quantization) or "hnsw" (graph)
+INDEX_TYPE = os.getenv("INDEX_TYPE", "flat")
+
+# IVF-PQ build parameters; nlist=0 picks ~4*sqrt(n) lists for the n training vectors
+IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))
+PQ_M = int(os.getenv("PQ_M", "64"))  # sub-quantizers (bytes per vector at 8 bits); lowered to a divisor of the dimension
+PQ_NBITS = 8
+ANN_TRAIN_SIZE = int(os.getenv("ANN_TRAIN_SIZE", "20000"))  # vectors sampled to train IVF-PQ
+MIN_TRAIN_PER_CENTROID = 39  # FAISS k-means needs this many points per centroid
+
+# HNSW build parameters
+HNSW_M = int(os.getenv("HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "200"))
+
+# Query-time recall/speed knobs (set on every loaded index)
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+
+
+def index_settings(index_type=INDEX_TYPE):
+    """Build settings recorded in the manifest; changing them rebuilds the index."""
+    if index_type == "ivfpq":
+        return {"type": "ivfpq", "nlist": IVF_NLIST, "pq_m": PQ_M, "pq_nbits": PQ_NBITS}
+    if index_type == "hnsw":
+        return {"type": "hnsw", "m": HNSW_M, "ef_construction": HNSW_EF_CONSTRUCTION}
+    return {"type": "flat"}
+
+
+def needs_training(index_type=INDEX_TYPE):
+    return index_type == "ivfpq"
+
+
+def _nlist(n):
+    return IVF_NLIST or max(1, min(int(4 * math.sqrt(n)), n // MIN_TRAIN_PER_CENTROID))
+
+
+def min_train_size():
+    """Vectors needed to train the PQ codebooks (2^nbits centroids per sub-quantizer)."""
+    return MIN_TRAIN_PER_CENTROID * 2 ** PQ_NBITS
+
+
+def _pq_m(dim):
+    return max(m for m in range(1, min(PQ_M, dim) + 1) if dim % m == 0)
+
+
+def create_index(vectors, index_type=INDEX_TYPE):
+    """
+    Empty index of the given type for vectors of this dimension, keyed by row id.
+    IVF-PQ is trained on a random sample of `vectors` (up to ANN_TRAIN_SIZE); with
+    too few vectors to train it, a flat index is returned instead.
+    Returns (index, actual index type).
+    """
+    dim = vectors.shape[1]
+    if index_type == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dim, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return configure(faiss.IndexIDMap2(hnsw)), "hnsw"
+
+    if index_type == "ivfpq":
+        if len(vectors) >= min_train_size():
+            sample = vectors
+            if len(vectors) > ANN_TRAIN_SIZE:
+                sample = vectors[np.random.default_rng(0).choice(len(vectors), ANN_TRAIN_SIZE, replace=False)]
+            index = faiss.IndexIVFPQ(faiss.IndexFlatL2(dim), dim, _nlist(len(sample)), _pq_m(dim), PQ_NBITS)
+            index.train(np.ascontiguousarray(sample))
+            return configure(index), "ivfpq"
+        print(f"⚠ {len(vectors)} vectors are too few to train IVF-PQ (need {min_train_size()}), using a flat index")
+
+    return faiss.IndexIDMap2(faiss.IndexFlatL2(dim)), "flat"
+
+
+def configure(index):
+    """Apply the query-time parameters (nprobe / efSearch) for the index's type."""
+    kind = index_kind(index)
+    params = faiss.ParameterSpace()
+    if kind == "ivfpq":
+        params.set_index_parameter(index, "nprobe", IVF_NPROBE)
+    elif kind == "hnsw":
+        params.set_index_parameter(index, "efSearch", HNSW_EF_SEARCH)
+    return index
+
+
+def index_kind(index):
+    """"flat", "ivfpq" or "hnsw" for a (possibly id-mapped) FAISS index."""
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap) else index
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivfpq"
+    return "flat"
+
+
+def remove_ids(index, ids):
+    """
+    Remove vectors by row id. HNSW graphs do not support removal, so the index is
+    rebuilt from its remaining stored vectors (no re-embedding). Returns the index.
+    """
+    ids = np.asarray(ids, dtype="int64")
+    if index_kind(index) != "hnsw":
+        index.remove_ids(ids)
+        return index
+
+    row_ids = faiss.vector_to_array(index.id_map)
+    vectors = faiss.downcast_index(index.index).reconstruct_n(0, index.ntotal)
+    keep = ~np.isin(row_ids, ids)
+    rebuilt, _ = create_index(vectors, "hnsw")
+    if keep.any():
+        rebuilt.add_with_ids(vectors[keep], row_ids[keep])
+    return rebuilt
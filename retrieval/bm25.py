@@ -0,0 +1,134 @@
+# retrieval/bm25.py
+import re
+import json
+import math
+import heapq
+from collections import Counter, defaultdict
+
+from retrieval.chunker import indexed_text
+
+# Keeps part numbers, acronyms and codes together (e.g. "iso-28000", "c-tpat", "3.5")
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-./][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "our", "should", "that", "the", "their", "this", "to", "we", "what",
+    "when", "which", "who", "why", "with", "you", "your",
+}
+POSTING_BYTES = 100  # measured heap per posting (dict entry, ints and a share of the term strings)
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over chunk texts, keyed by the same row ids
+    as the FAISS index.
+    """
+
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(dict)  # term -> {row_id: term frequency}
+        self.doc_len = {}
+        self.total_len = 0
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        index = cls()
+        for row_id, chunk in chunks.items():
+            index.add(row_id, indexed_text(chunk))
+        return index
+
+    def add(self, row_id, text):
+        tokens = tokenize(text)
+        self.doc_len[row_id] = len(tokens)
+        self.total_len += len(tokens)
+        for term, tf in Counter(tokens).items():
+            self.postings[term][row_id] = tf
+
+    def memory_bytes(self):
+        """Estimated heap size of the loaded index."""
+        return POSTING_BYTES * sum(len(rows) for rows in self.postings.values())
+
+    def idf(self, term):
+        df = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.doc_len) - df + 0.5) / (df + 0.5))
+
+    def avgdl(self):
+        return max(self.total_len / len(self.doc_len), 1.0) if self.doc_len else 1.0
+
+    def search(self, query, k=3):
+        """
+        Top-k (row_id, score) pairs, plus the share of the query's IDF weight
+        whose terms all occur in the top hit (1.0 = every query term matched).
+        """
+        terms = set(tokenize(query))
+        if not terms or not self.doc_len:
+            return [], 0.0
+
+        avgdl = self.avgdl()
+        scores = defaultdict(float)
+        idfs = {term: self.idf(term) for term in terms}
+        for term, idf in idfs.items():
+            for row_id, tf in self.postings.get(term, {}).items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_len[row_id] / avgdl)
+                scores[row_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        if not top:
+            return [], 0.0
+        best = top[0][0]
+        matched = sum(idf for term, idf in idfs.items() if best in self.postings.get(term, ()))
+        return top, matched / sum(idfs.values())
+
+    def score_tokens(self, terms, tokens):
+        """BM25 score of an already tokenized text for the query terms, using this index's statistics."""
+        counts = Counter(tokens)
+        avgdl = self.avgdl()
+        norm = self.k1 * (1 - self.b + self.b * len(tokens) / avgdl)
+        return sum(self.idf(term) * counts[term] * (self.k1 + 1) / (counts[term] + norm)
+                   for term in terms if counts[term])
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({
+                "k1": self.k1,
+                "b": self.b,
+                "doc_len": [[row_id, n] for row_id, n in self.doc_len.items()],
+                "postings": {term: [[row_id, tf] for row_id, tf in rows.items()] for term, rows in self.postings.items()},
+            }, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data["k1"], b=data["b"])
+        index.doc_len = {row_id: n for row_id, n in data["doc_len"]}
+        index.total_len = sum(index.doc_len.values())
+        for term, rows in data["postings"].items():
+            index.postings[term] = {row_id: tf for row_id, tf in rows}
+        return index
+
+
+class MergedBM25(BM25Index):
+    """
+    BM25 statistics of several indexes taken together, as if their chunks were in
+    one index, so texts from different shards get comparable scores. For scoring
+    (idf, score_tokens) only; it holds no postings of its own.
+    """
+
+    def __init__(self, indexes):
+        indexes = list(indexes)
+        super().__init__(*((indexes[0].k1, indexes[0].b) if indexes else ()))
+        self.indexes = indexes
+        self.doc_count = sum(len(index.doc_len) for index in indexes)
+        self.total_len = sum(index.total_len for index in indexes)
+
+    def idf(self, term):
+        df = sum(len(index.postings.get(term, ())) for index in self.indexes)
+        return math.log(1 + (self.doc_count - df + 0.5) / (df + 0.5))
+
+    def avgdl(self):
+        return max(self.total_len / self.doc_count, 1.0) if self.doc_count else 1.0
@@ -0,0 +1,202 @@
+# retrieval/chunk_store.py
+import os
+import json
+import mmap
+
+import numpy as np
+
+BLOB_FILE = "chunks.bin"  # UTF-8 chunk texts, back to back
+ROWS_FILE = "chunks.npy"  # one fixed-width record per chunk, sorted by row id
+TABLES_FILE = "chunks.json"  # document names and section titles the records point into
+
+ROW_DTYPE = np.dtype([
+    ("row_id", "<i8"),
+    ("offset", "<i8"),
+    ("length", "<i4"),
+    ("doc", "<i4"),
+    ("number", "<i4"),  # chunk number within the document (chunk_id suffix)
+    ("page", "<i4"),
+    ("section", "<i4"),  # -1 when the chunk precedes the document's first heading
+    ("tokens", "<i4"),
+])
+
+
+class ChunkStore:
+    """
+    Chunk texts and metadata in columns, keyed by FAISS row id: one record array
+    plus one text blob instead of a dict per chunk. Loaded from disk both are
+    memory-mapped, so only the pages of chunks that are actually read become
+    resident, and a lookup decodes just that chunk's bytes. Reads like a dict
+    of chunk dicts (chunks[row_id]["text"], len, in, items()).
+    """
+
+    def __init__(self, rows=None, blob=b"", doc_names=(), sections=()):
+        self._set_rows(rows if rows is not None else np.zeros(0, dtype=ROW_DTYPE))
+        self._blob = blob
+        self.mapped = isinstance(blob, mmap.mmap)
+        self._view = memoryview(blob) if self.mapped else None
+        self._pending = []  # records appended since the last read, concatenated lazily
+        self.doc_names = list(doc_names)
+        self.sections = list(sections)
+        self._doc_ids = {name: i for i, name in enumerate(self.doc_names)}
+        self._section_ids = {title: i for i, title in enumerate(self.sections)}
+
+    @classmethod
+    def load(cls, index_dir, mmap_files=True):
+        """Open a saved store. With mmap_files=False it is read into memory so it can be modified."""
+        with open(os.path.join(index_dir, TABLES_FILE), "r", encoding="utf-8") as f:
+            tables = json.load(f)
+        #A plain ndarray view of the np.memmap: same mapped pages without the subclass's per-access overhead
+        rows = np.load(os.path.join(index_dir, ROWS_FILE), mmap_mode="r" if mmap_files else None).view(np.ndarray)
+        blob_path = os.path.join(index_dir, BLOB_FILE)
+        if not mmap_files:
+            with open(blob_path, "rb") as f:
+                blob = bytearray(f.read())
+        elif os.path.getsize(blob_path):
+            with open(blob_path, "rb") as f:
+                blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            if hasattr(blob, "madvise"):
+                blob.madvise(mmap.MADV_RANDOM)  # search hits are scattered; read-ahead would page in neighbours
+        else:
+            blob = b""  # an empty file cannot be mapped
+        return cls(rows, blob, tables["doc_names"], tables["sections"])
+
+    def save(self, index_dir):
+        """Write the three files, each via a temp file and rename; the blob is compacted in row order."""
+        rows = self.rows.copy()
+        blob = b"".join(self._bytes(offset, length)
+                        for offset, length in zip(rows["offset"].tolist(), rows["length"].tolist()))
+        rows["offset"] = np.cumsum(rows["length"], dtype="int64") - rows["length"]
+
+        def write(name, mode, fn):
+            path = os.path.join(index_dir, name)
+            with open(path + ".tmp", mode) as f:
+                fn(f)
+            os.replace(path + ".tmp", path)
+
+        write(BLOB_FILE, "wb", lambda f: f.write(blob))
+        write(ROWS_FILE, "wb", lambda f: np.save(f, rows))
+        write(TABLES_FILE, "w", lambda f: json.dump({"doc_names": self.doc_names, "sections": self.sections}, f))
+
+    def _intern(self, table, ids, value):
+        if value not in ids:
+            ids[value] = len(table)
+            table.append(value)
+        return ids[value]
+
+    def extend(self, row_ids, chunks):
+        """Append chunks (dicts from retrieval.ingest) under increasing row ids larger than any stored."""
+        if not isinstance(self._blob, bytearray):
+            self._blob = bytearray(self._blob)
+            self._set_rows(np.array(self._rows))
+            self._view = None
+            self.mapped = False
+        for row_id, chunk in zip(row_ids, chunks):
+            data = chunk["text"].encode("utf-8")
+            section = chunk.get("section")
+            self._pending.append((
+                row_id, len(self._blob), len(data),
+                self._intern(self.doc_names, self._doc_ids, chunk["doc_name"]),
+                chunk["number"], chunk.get("page") or 0,
+                self._intern(self.sections, self._section_ids, section) if section else -1,
+                chunk.get("tokens", 0),
+            ))
+            self._blob += data
+
+    def remove(self, row_ids):
+        """Drop chunks by row id; their text bytes are reclaimed on the next save."""
+        self._set_rows(np.array(self.rows[~np.isin(self._ids, np.asarray(list(row_ids), dtype="int64"))]))
+
+    def _set_rows(self, rows):
+        self._rows = rows
+        self._ids = rows["row_id"]
+
+    @property
+    def rows(self):
+        if self._pending:
+            self._set_rows(np.concatenate([self._rows, np.array(self._pending, dtype=ROW_DTYPE)]))
+            self._pending = []
+        return self._rows
+
+    def _bytes(self, offset, length):
+        if self._view is not None:
+            return self._view[offset:offset + length]
+        return self._blob[offset:offset + length]
+
+    def _position(self, row_id):
+        if self._pending:
+            self.rows
+        ids = self._ids
+        #Row ids are dense until documents are removed, so the id is usually its own position
+        i = row_id if 0 <= row_id < len(ids) and ids[row_id] == row_id else int(np.searchsorted(ids, row_id))
+        if i == len(ids) or ids[i] != row_id:
+            raise KeyError(row_id)
+        return i
+
+    def text(self, row_id):
+        _, offset, length = self.rows[self._position(row_id)].tolist()[:3]
+        return str(self._bytes(offset, length), "utf-8")
+
+    def _chunk(self, record):
+        row_id, offset, length, doc, number, page, section, tokens = record.tolist()
+        doc_name = self.doc_names[doc]
+        return {
+            "row_id": row_id,
+            "chunk_id": f"{doc_name}__chunk_{number}",
+            "doc_name": doc_name,
+            "page": page or None,
+            "section": self.sections[section] if section >= 0 else None,
+            "tokens": tokens,
+            "text": str(self._bytes(offset, length), "utf-8"),
+        }
+
+    def __getitem__(self, row_id):
+        return self._chunk(self.rows[self._position(row_id)])
+
+    def get(self, row_id, default=None):
+        try:
+            return self[row_id]
+        except KeyError:
+            return default
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, row_id):
+        try:
+            self._position(row_id)
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return iter(self.rows["row_id"].tolist())
+
+    def items(self):
+        for record in self.rows:
+            yield int(record["row_id"]), self._chunk(record)
+
+    def values(self):
+        for _, chunk in self.items():
+            yield chunk
+
+    def row_ids_of(self, doc_names):
+        """Row ids of every chunk of the given documents."""
+        doc_ids = [self._doc_ids[name] for name in doc_names if name in self._doc_ids]
+        rows = self.rows
+        return rows["row_id"][np.isin(rows["doc"], doc_ids)].tolist()
+
+    def documents(self):
+        """Names of the documents that still have chunks."""
+        return {self.doc_names[i] for i in np.unique(self.rows["doc"]).tolist()}
+
+    def next_row_id(self):
+        rows = self.rows
+        return int(rows["row_id"][-1]) + 1 if len(rows) else 0
+
+    def memory_usage(self):
+        """Bytes on the Python heap vs. memory-mapped (paged in on demand, shared with the page cache)."""
+        tables = sum(len(s) for s in self.doc_names) + sum(len(s) for s in self.sections)
+        data = self.rows.nbytes + len(self._blob)
+        return {"chunks": len(self), "heap_bytes": tables + (0 if self.mapped else data),
+                "mapped_bytes": data if self.mapped else 0}
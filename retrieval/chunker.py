@@ -0,0 +1,198 @@
+# retrieval/chunker.py
+import os
+import re
+import math
+import threading
+
+CHUNK_ENCODING = os.getenv("CHUNK_ENCODING", "cl100k_base")  # tokenizer of the OpenAI embedding models
+MIN_CHUNK_TOKENS = 16  # smaller page tails (footers, page numbers) are merged into the previous chunk
+MIN_CHUNK_CHARS = 20  # word characters; chunks that are mostly dot leaders or rules are dropped too
+
+HEADING_MAX_CHARS = 80
+HEADING_MAX_WORDS = 10
+NUMBERED_RE = re.compile(r"^(?:\d+(?:\.\d+)*\.?|[A-Z]\.|[IVX]+\.)\s+\S")
+BULLET_RE = re.compile(r"^(?:[•▪◦‣●*]|-\s|\(?[0-9a-z]{1,2}[.)]\s)")
+#PDF extraction often drops periods and leaves a run of spaces instead, so that counts as a sentence end too
+WORD_RE = re.compile(r"\w")
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"“(\[•])|\s{3,}(?=[A-Z])")
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """tiktoken encoding CHUNK_ENCODING, or False if unavailable (offline without a cached BPE file)."""
+    global _encoder
+    with _encoder_lock:
+        if _encoder is None:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding(CHUNK_ENCODING)
+            except Exception as e:
+                print(f"⚠ tiktoken unavailable ({type(e).__name__}), sizing chunks by ~4 characters per token")
+                _encoder = False
+        return _encoder
+
+
+def tokenizer_name():
+    """Recorded in the index manifest: chunk boundaries depend on the tokenizer."""
+    return CHUNK_ENCODING if _get_encoder() else "chars/4"
+
+
+def count_tokens(text):
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4) if text else 0
+
+
+def indexed_text(chunk):
+    """
+    Text that is embedded and BM25-indexed for a chunk (or a retrieval result): the
+    document title and section, then the chunk, so a chunk cut from the middle of a
+    section still matches queries about its document and heading.
+    """
+    title = os.path.splitext(chunk["doc_name"])[0]
+    section = chunk.get("section")
+    return f"{title} | {section}\n{chunk['text']}" if section else f"{title}\n{chunk['text']}"
+
+
+def is_heading(line):
+    """
+    Short title-case or numbered line without sentence punctuation, e.g. "B. Customs
+    Clearance Cycle". Wrapped body lines and name/affiliation lists usually contain
+    a comma, a bracket or lowercase words, which rules them out.
+    """
+    words = line.split()
+    if not words or len(line) > HEADING_MAX_CHARS or len(words) > HEADING_MAX_WORDS:
+        return False
+    if line[-1] in ".-" or any(c in line for c in ",;()") or BULLET_RE.match(line):
+        return False
+    if not (line[0].isupper() or NUMBERED_RE.match(line)):
+        return False
+    long_words = [w for w in words if len(w) > 3 and w[0].isalpha()]
+    return bool(long_words) and sum(w[0].isupper() for w in long_words) / len(long_words) >= 0.75
+
+
+class StructuredChunker:
+    """
+    Splits the pages of one document into chunks of at most chunk_tokens tokens
+    that end at sentence boundaries, preferring paragraph ends, and never cross a
+    section heading or page. A heading starts the next chunk and becomes its
+    section (carried over to the following pages); sections shorter than a quarter
+    chunk are kept together with the next one. Consecutive chunks of a section
+    share up to overlap_tokens of trailing sentences. Chunk texts are slices of the
+    page text, so line breaks are kept.
+    """
+
+    def __init__(self, chunk_tokens, overlap_tokens):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.section = None
+
+    def _units(self, text):
+        """(start, end, kind, tokens, new_block) spans of a page; kind is "heading" or "sentence"."""
+        units = []
+        paragraph = None  # [start, end] of the paragraph being collected
+
+        def flush():
+            if paragraph is None:
+                return
+            start, end = paragraph
+            new_block = True
+            for match in list(SENTENCE_END_RE.finditer(text, start, end)) + [None]:
+                stop = match.start() if match else end
+                if stop > start:
+                    for piece in self._fit(text, start, stop):
+                        units.append((*piece, "sentence", count_tokens(text[piece[0]:piece[1]]), new_block))
+                        new_block = False
+                start = match.end() if match else end
+
+        offset = 0
+        for line in text.splitlines(keepends=True):
+            start, offset = offset, offset + len(line)
+            stripped = line.strip()
+            if not stripped:
+                flush()
+                paragraph = None
+                continue
+            start += len(line) - len(line.lstrip())
+            end = start + len(stripped)
+            if is_heading(stripped):
+                flush()
+                paragraph = None
+                units.append((start, end, "heading", count_tokens(stripped), True))
+            elif paragraph is None or BULLET_RE.match(stripped):
+                flush()
+                paragraph = [start, end]
+            else:
+                paragraph[1] = end
+        flush()
+        return units
+
+    def _fit(self, text, start, end):
+        """Cut a run-on sentence longer than chunk_tokens into roughly equal pieces at whitespace."""
+        tokens = count_tokens(text[start:end])
+        if tokens <= self.chunk_tokens:
+            return [(start, end)]
+        pieces = []
+        step = (end - start) / math.ceil(tokens * 1.1 / self.chunk_tokens)
+        while end - start > step * 1.5:
+            cut = text.rfind(" ", start + 1, int(start + step))
+            cut = cut if cut > start else int(start + step)
+            pieces.append((start, cut))
+            start = cut + 1
+        pieces.append((start, end))
+        return pieces
+
+    def split_page(self, text):
+        """Chunks of one page as dicts with section, text and tokens, in order."""
+        chunks = []  # [section, start, end]
+        current = []  # units of the chunk being filled, each tagged with its section
+
+        def tokens(units):
+            return sum(u[3] for u in units)
+
+        def emit(units):
+            sentences = [u for u in units if u[2] == "sentence"]
+            chunks.append([sentences[0][5] if sentences else self.section, units[0][0], units[-1][1]])
+
+        def overlap(units):
+            tail = []
+            for unit in reversed(units):
+                if unit[2] == "heading" or tokens(tail) + unit[3] > self.overlap_tokens:
+                    break
+                tail.insert(0, unit)
+            return tail
+
+        for unit in self._units(text):
+            if unit[2] == "heading":
+                self.section = " ".join(text[unit[0]:unit[1]].split())
+                if tokens(u for u in current if u[2] == "sentence") >= self.chunk_tokens / 4:
+                    emit(current)
+                    current = []
+                current.append((*unit, self.section))
+                continue
+            unit = (*unit, self.section)
+            while current and tokens(current) + unit[3] > self.chunk_tokens:
+                #Cut at the last paragraph start past half a chunk, otherwise after the last sentence with overlap
+                cuts = [i for i in range(1, len(current)) if current[i][4] and current[i - 1][2] != "heading"
+                        and tokens(current[:i]) >= self.chunk_tokens / 2]
+                if cuts:
+                    emit(current[:cuts[-1]])
+                    current = current[cuts[-1]:]
+                else:
+                    emit(current)
+                    current = overlap(current)
+                    if tokens(current) + unit[3] > self.chunk_tokens:
+                        current = []
+            current.append(unit)
+
+        if any(u[2] == "sentence" for u in current):
+            if tokens(current) < MIN_CHUNK_TOKENS and chunks:
+                chunks[-1][2] = current[-1][1]
+            else:
+                emit(current)
+        pieces = [(section, text[start:end].strip()) for section, start, end in chunks]
+        return [{"section": section, "text": piece, "tokens": count_tokens(piece)} for section, piece in pieces
+                if len(WORD_RE.findall(piece)) >= max(MIN_CHUNK_CHARS, len("".join(piece.split())) / 2)]
@@ -0,0 +1,145 @@
+# retrieval/embedding_cache.py
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import tracing
+
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", os.path.join(os.path.dirname(__file__), "..", ".cache", "embeddings.sqlite"))
+EMBED_CACHE_MAX_MB = float(os.getenv("EMBED_CACHE_MAX_MB", "512"))
+EMBED_REQUEST_BATCH = int(os.getenv("EMBED_REQUEST_BATCH", "256"))  # texts per embedding API call
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))  # embedding API calls in flight
+
+
+def normalize_text(text):
+    """Normalize unicode and whitespace so trivially different copies share one embedding."""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def cache_key(model, text):
+    """Content address of an embedding: (model, normalized text hash)."""
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain Embeddings wrapper with a persistent SQLite cache keyed by
+    (model, normalized text hash). Misses are deduplicated, sent in batches of
+    EMBED_REQUEST_BATCH with at most EMBED_CONCURRENCY calls in flight, and the
+    least recently used vectors are evicted once the cache exceeds its size cap.
+    """
+
+    def __init__(self, embeddings, model, path=EMBED_CACHE_PATH, max_mb=EMBED_CACHE_MAX_MB,
+                 batch_size=EMBED_REQUEST_BATCH, max_concurrency=EMBED_CONCURRENCY):
+        self.embeddings = embeddings
+        self.model = model
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.stats = {"hits": 0, "misses": 0, "api_calls": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, vector BLOB NOT NULL, nbytes INTEGER NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        return self._conn
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            db = self._db()
+            unique = list(set(keys))
+            for start in range(0, len(unique), 500):
+                part = unique[start:start + 500]
+                rows = db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype="float32").tolist()
+            if found:
+                now = time.time()
+                db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                db.commit()
+        return found
+
+    def _store(self, vectors):
+        now = time.time()
+        rows = []
+        for key, vector in vectors.items():
+            blob = np.asarray(vector, dtype="float32").tobytes()
+            rows.append((key, blob, len(blob), now))
+        with self._lock:
+            db = self._db()
+            db.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)", rows)
+            db.commit()
+            self._evict(db)
+
+    def _evict(self, db):
+        """Drop least recently used vectors until the cache is back under 90% of its cap."""
+        total = db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, nbytes in db.execute("SELECT key, nbytes FROM embeddings ORDER BY last_used"):
+            if total - freed <= target:
+                break
+            stale.append((key,))
+            freed += nbytes
+        db.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        db.commit()
+
+    def _embed_misses(self, texts_by_key):
+        """Embed cache misses in batches with bounded concurrency."""
+        keys = list(texts_by_key)
+        batches = [keys[i:i + self.batch_size] for i in range(0, len(keys), self.batch_size)]
+
+        def embed_batch(batch_keys):
+            return batch_keys, self.embeddings.embed_documents([texts_by_key[key] for key in batch_keys])
+
+        vectors = {}
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as pool:
+            for batch_keys, batch_vectors in pool.map(embed_batch, batches):
+                vectors.update(zip(batch_keys, batch_vectors))
+        self.stats["api_calls"] += len(batches)
+        return vectors
+
+    def embed_documents(self, texts):
+        with tracing.span("embeddings", texts=len(texts)) as span:
+            keys = [cache_key(self.model, text) for text in texts]
+            vectors = self._lookup(keys)
+
+            misses = {}
+            for key, text in zip(keys, texts):
+                if key not in vectors and key not in misses:
+                    misses[key] = normalize_text(text)
+            self.stats["hits"] += len(texts) - len(misses)
+            self.stats["misses"] += len(misses)
+            span.set(cache_hits=len(texts) - len(misses), misses=len(misses))
+
+            if misses:
+                with tracing.span("embeddings.api", texts=len(misses)):
+                    embedded = self._embed_misses(misses)
+                self._store(embedded)
+                vectors.update(embedded)
+            return [vectors[key] for key in keys]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
@@ -0,0 +1,145 @@
+# retrieval/ingest.py
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import PyPDF2
+
+from retrieval.chunker import StructuredChunker
+
+# Pages extracted per worker task, and worker processes for extraction
+PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", "8"))
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+
+def _page_count(path):
+    with open(path, "rb") as pdf_file:
+        return len(PyPDF2.PdfReader(pdf_file).pages)
+
+
+def _extract_pages(path, start, end):
+    """Worker: extract pages [start, end) of a PDF as (seconds, [(page_number, text)]), 1-based."""
+    started = time.perf_counter()
+    with open(path, "rb") as pdf_file:
+        pdf_reader = PyPDF2.PdfReader(pdf_file)
+        pages = [(page_num + 1, pdf_reader.pages[page_num].extract_text() or "") for page_num in range(start, end)]
+    return time.perf_counter() - started, pages
+
+
+def _read_text(path):
+    """Worker: a TXT file is a single page."""
+    started = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        pages = [(1, f.read())]
+    return time.perf_counter() - started, pages
+
+
+def _tasks(files):
+    """Split every file into page-range tasks (path, fn, args)."""
+    for path in files:
+        if path.lower().endswith(".pdf"):
+            try:
+                pages = _page_count(path)
+            except Exception as e:
+                print(f"⚠ Error loading {path}: {e}")
+                continue
+            for start in range(0, pages, PAGES_PER_TASK):
+                yield path, _extract_pages, (path, start, min(start + PAGES_PER_TASK, pages))
+            if pages == 0:
+                yield path, None, ()
+        else:
+            yield path, _read_text, (path,)
+
+
+def _ordered_pages(files, executor, window):
+    """
+    Run page-range tasks across the pool and yield (path, (seconds, pages)) in document order.
+    At most `window` tasks are in flight, so memory stays bounded by the window
+    rather than by document size.
+    """
+    tasks = _tasks(files)
+    in_flight = deque()
+
+    def submit_next():
+        for path, fn, args in tasks:
+            in_flight.append((path, executor.submit(fn, *args) if fn else None))
+            return True
+        return False
+
+    while len(in_flight) < window and submit_next():
+        pass
+    while in_flight:
+        path, future = in_flight.popleft()
+        submit_next()
+        try:
+            yield path, future.result() if future else (0.0, [])
+        except Exception as e:
+            yield path, e
+
+
+def ingest(files, chunk_tokens, overlap_tokens, stats=None):
+    """
+    Stream chunks from source files: pages are extracted in a process pool and fed
+    to the structure-aware chunker (retrieval/chunker.py) page by page as they
+    arrive. Each chunk carries chunk_id (`<doc_name>__chunk_<n>`), its number n,
+    doc_name, page, section and tokens. Per-file extraction stats are
+    printed and appended to `stats` if given; extract_sec is worker time summed over
+    the file's page ranges, so it is unaffected by files extracting concurrently.
+    """
+    workers = max(1, INGEST_WORKERS)
+
+    current = None
+    failed = set()
+
+    def finish(file_stats):
+        elapsed = file_stats["extract_sec"]
+        file_stats["extract_sec"] = round(elapsed, 3)
+        file_stats["pages_per_sec"] = round(file_stats["pages"] / elapsed, 1) if elapsed > 0 else 0.0
+        file_stats["mb_per_sec"] = round(file_stats["chars"] / 1e6 / elapsed, 2) if elapsed > 0 else 0.0
+        if stats is not None:
+            stats.append(file_stats)
+        if file_stats["doc_name"] in failed:
+            return
+        if file_stats["chunks"]:
+            print(f"✓ Loaded {file_stats['doc_name']}: {file_stats['pages']} pages, {file_stats['chunks']} chunks "
+                  f"in {elapsed:.2f}s ({file_stats['pages_per_sec']} pages/s)")
+        else:
+            print(f"⚠ No text extracted from {file_stats['doc_name']}")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for path, result in _ordered_pages(files, executor, window=2 * workers):
+            doc_name = os.path.basename(path)
+            if current is None or current["doc_name"] != doc_name:
+                if current is not None:
+                    finish(current)
+                current = {"doc_name": doc_name, "pages": 0, "chars": 0, "chunks": 0, "extract_sec": 0.0}
+                chunker = StructuredChunker(chunk_tokens, overlap_tokens)
+
+            if isinstance(result, Exception):
+                if doc_name not in failed:
+                    print(f"⚠ Error loading {path}: {result}")
+                failed.add(doc_name)
+                continue
+
+            seconds, pages = result
+            current["extract_sec"] += seconds
+            for page_num, text in pages:
+                current["pages"] += 1
+                current["chars"] += len(text)
+                if not text.strip():
+                    continue
+                for piece in chunker.split_page(text):
+                    yield {
+                        "chunk_id": f"{doc_name}__chunk_{current['chunks']}",
+                        "number": current["chunks"],
+                        "doc_name": doc_name,
+                        "page": page_num,
+                        "section": piece["section"],
+                        "tokens": piece["tokens"],
+                        "text": piece["text"],
+                    }
+                    current["chunks"] += 1
+
+        if current is not None:
+            finish(current)
@@ -0,0 +1,149 @@
+# retrieval/reranker.py
+import os
+import threading
+from functools import lru_cache
+from collections import OrderedDict
+
+import numpy as np
+
+from retrieval.bm25 import tokenize
+from retrieval.chunker import indexed_text
+
+#Retrieve-many-then-rerank: search over-fetches RERANK_FETCH_K candidates and the reranker keeps the top k
+RERANK = os.getenv("RERANK", "1") != "0"
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "30"))
+RERANKER = os.getenv("RERANKER", "features")  # "features" (lexical/dense scorer) or "cross-encoder"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))  # (query, passage) pairs per cross-encoder call
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))  # reranked result lists kept in memory
+CHUNK_FEATURE_CACHE_SIZE = 8192  # tokenized chunks kept for the feature scorer
+
+#Feature scorer weights: dense similarity and BM25 score (both relative to the query's
+#candidates), IDF-weighted query-term coverage and share of query bigrams found in the chunk
+FEATURE_WEIGHTS = np.array([0.35, 0.35, 0.2, 0.1], dtype="float32")
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0}
+
+_cross_encoder = None
+_cross_encoder_lock = threading.Lock()
+
+
+def cache_get(key):
+    """Cached result list for key (a copy), or None. Hits move to the most recently used end."""
+    with _cache_lock:
+        ranking = _cache.get(key)
+        if ranking is None:
+            cache_stats["misses"] += 1
+            return None
+        _cache.move_to_end(key)
+        cache_stats["hits"] += 1
+        return [dict(result) for result in ranking]
+
+
+def cache_put(key, ranking):
+    with _cache_lock:
+        _cache[key] = [dict(result) for result in ranking]
+        _cache.move_to_end(key)
+        while len(_cache) > QUERY_CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def clear_cache():
+    with _cache_lock:
+        _cache.clear()
+
+
+def _bigrams(tokens):
+    return set(zip(tokens, tokens[1:]))
+
+
+@lru_cache(maxsize=CHUNK_FEATURE_CACHE_SIZE)
+def _chunk_terms(text):
+    """Tokens, term set and bigrams of a chunk; the same chunks are candidates for many queries."""
+    tokens = tokenize(text)
+    return tokens, set(tokens), _bigrams(tokens)
+
+
+def feature_scores(queries, candidate_lists, lexical, distance_lists):
+    """
+    Score every candidate of every query from cheap features, all queries in one pass:
+    dense similarity from the candidate's L2 distance to the query (min-max scaled
+    within the query's candidates; None counts as the farthest), BM25 score (relative
+    to the best candidate), IDF-weighted query-term coverage and query-bigram overlap.
+    Chunk tokenization is memoized across calls.
+    """
+    scores = []
+    for query, candidates, distances in zip(queries, candidate_lists, distance_lists):
+        if not candidates:
+            scores.append(np.zeros(0, dtype="float32"))
+            continue
+        query_tokens = tokenize(query)
+        weights = {term: lexical.idf(term) for term in set(query_tokens)}
+        total_weight = sum(weights.values()) or 1.0
+        query_bigrams = _bigrams(query_tokens)
+
+        features = np.zeros((len(candidates), 4), dtype="float32")
+        known = [d for d in distances if d is not None]
+        worst, best = max(known, default=0.0), min(known, default=0.0)
+        for row, (result, distance) in enumerate(zip(candidates, distances)):
+            tokens, terms, bigrams = _chunk_terms(indexed_text(result))
+            if distance is not None:
+                features[row, 0] = (worst - distance) / (worst - best) if worst > best else 1.0
+            features[row, 1] = lexical.score_tokens(weights, tokens)
+            features[row, 2] = sum(w for term, w in weights.items() if term in terms) / total_weight
+            features[row, 3] = len(query_bigrams & bigrams) / len(query_bigrams) if query_bigrams else 0.0
+        features[:, 1] /= max(features[:, 1].max(), 1e-9)
+        scores.append(features @ FEATURE_WEIGHTS)
+    return scores
+
+
+def _get_cross_encoder():
+    """sentence-transformers CrossEncoder for RERANK_MODEL, or False if it cannot be loaded."""
+    global _cross_encoder
+    with _cross_encoder_lock:
+        if _cross_encoder is None:
+            try:
+                from sentence_transformers import CrossEncoder
+                _cross_encoder = CrossEncoder(RERANK_MODEL, device="cpu")
+            except Exception as e:
+                print(f"⚠ Cross-encoder {RERANK_MODEL} unavailable ({type(e).__name__}), using the feature reranker")
+                _cross_encoder = False
+        return _cross_encoder
+
+
+def cross_encoder_scores(queries, candidate_lists):
+    """Cross-encoder relevance of every (query, chunk) pair, predicted in batches of RERANK_BATCH_SIZE."""
+    model = _get_cross_encoder()
+    if not model:
+        return None
+    pairs = [(query, result["text"]) for query, candidates in zip(queries, candidate_lists) for result in candidates]
+    flat = np.asarray(model.predict(pairs, batch_size=RERANK_BATCH_SIZE), dtype="float32") if pairs else []
+    scores, start = [], 0
+    for candidates in candidate_lists:
+        scores.append(flat[start:start + len(candidates)])
+        start += len(candidates)
+    return scores
+
+
+def rerank_many(queries, candidate_lists, k, lexical, distance_lists=None, reranker=None):
+    """
+    Rerank each query's candidates and keep the top k. Returns one list per query;
+    kept results are copies carrying a rerank_score. distance_lists gives each
+    candidate's L2 distance to its query for the feature scorer (defaults to the
+    similarity_score retrieval returned, which lexical-only candidates lack).
+    """
+    reranker = reranker or RERANKER
+    scores = cross_encoder_scores(queries, candidate_lists) if reranker == "cross-encoder" else None
+    if scores is None:
+        if distance_lists is None:
+            distance_lists = [[r.get("similarity_score") for r in candidates] for candidates in candidate_lists]
+        scores = feature_scores(queries, candidate_lists, lexical, distance_lists)
+
+    reranked = []
+    for candidates, query_scores in zip(candidate_lists, scores):
+        #Stable sort: ties keep the retrieval order
+        order = sorted(range(len(candidates)), key=lambda i: -float(query_scores[i]))[:k]
+        reranked.append([dict(candidates[i], rerank_score=round(float(query_scores[i]), 4)) for i in order])
+    return reranked
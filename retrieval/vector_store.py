@@ -2,85 +2,682 @@
 from dotenv import load_dotenv
 import os
 import glob
-import PyPDF2
+import json
+import hashlib
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+import numpy as np
+import faiss
 
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_text_splitters import CharacterTextSplitter
-from langchain_core.documents import Document
+from retrieval.bm25 import BM25Index, MergedBM25
+from retrieval.chunk_store import ChunkStore
+from retrieval.chunker import indexed_text, tokenizer_name
+from retrieval import ann
+from retrieval import reranker
+import tracing
 
 # Load .env
 load_dotenv()
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 
-# Load sample documents (PDFs and TXT files)
-documents = []
-data_dir = os.path.join(os.path.dirname(__file__), "..", "data")
+data_dir = os.getenv("DATA_DIR", os.path.join(os.path.dirname(__file__), "..", "data"))
 
-# Load PDF files
-pdf_files = glob.glob(os.path.join(data_dir, "*.pdf"))
-for pdf_path in pdf_files:
+# On-disk index artifact (FAISS vectors + chunk texts/metadata + manifest)
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(os.path.dirname(__file__), "..", ".index"))
+INDEX_VERSION = 4
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-ada-002")
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "30"))
+EMBED_BATCH_SIZE = 1024  # chunks handed to the embedding cache at a time while ingestion streams
+
+INDEX_FILE = "index.faiss"
+MANIFEST_FILE = "manifest.json"
+BM25_FILE = "bm25.json"
+
+# Named collections: files directly in data/ form the default collection, each
+# subdirectory of data/ another one. Every collection is a separate shard (its own
+# FAISS index, chunk store, BM25 index and manifest) under INDEX_DIR/collections/;
+# the default shard stays in INDEX_DIR itself
+DEFAULT_COLLECTION = "default"
+COLLECTIONS_DIR = "collections"
+# Loaded shards are unloaded least recently used first above this estimated size (0 = no cap)
+SHARD_MEMORY_MB = float(os.getenv("SHARD_MEMORY_MB", "1024"))
+SHARD_SEARCH_WORKERS = int(os.getenv("SHARD_SEARCH_WORKERS", "4"))  # shards searched in parallel per call
+
+# Retrieval mode: "dense" (FAISS only), "lexical" (BM25 only) or "hybrid" (both, fused)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Hybrid fast path: answer from BM25 alone (no embedding call) when the top hit
+# contains this share of the query's IDF weight and beats the runner-up by LEXICAL_MARGIN
+LEXICAL_CONFIDENT_COVERAGE = float(os.getenv("LEXICAL_CONFIDENT_COVERAGE", "0.9"))
+LEXICAL_MARGIN = float(os.getenv("LEXICAL_MARGIN", "1.3"))
+
+_embeddings = None
+_embeddings_lock = threading.Lock()
+
+
+def get_embeddings():
+    """
+    Process-wide embedding client, created on first use. Chunk and query embeddings
+    go through a persistent content-addressed cache.
+    """
+    global _embeddings
+    with _embeddings_lock:
+        if _embeddings is None:
+            #Imported here: the LangChain packages are by far the slowest imports in the app
+            from langchain_openai import OpenAIEmbeddings
+            from retrieval.embedding_cache import CachedEmbeddings
+            #(chunks are about CHUNK_TOKENS tokens, so the tiktoken context-length pass is skipped)
+            _embeddings = CachedEmbeddings(
+                OpenAIEmbeddings(model=EMBEDDING_MODEL, check_embedding_ctx_length=False), model=EMBEDDING_MODEL
+            )
+        return _embeddings
+
+
+def _collection_data_dir(collection):
+    return data_dir if collection == DEFAULT_COLLECTION else os.path.join(data_dir, collection)
+
+
+def _source_files(collection=DEFAULT_COLLECTION):
+    """PDF and TXT files of a collection, sorted for a stable manifest."""
+    directory = _collection_data_dir(collection)
+    files = glob.glob(os.path.join(directory, "*.pdf")) + glob.glob(os.path.join(directory, "*.txt"))
+    return sorted(files, key=os.path.basename)
+
+
+def _has_sources(directory):
+    """Whether a directory holds at least one PDF or TXT file (stops at the first)."""
+    with os.scandir(directory) as entries:
+        return any(entry.is_file() and entry.name.lower().endswith((".pdf", ".txt")) for entry in entries)
+
+
+def list_collections():
+    """
+    Names of the collections in data/: "default" (files directly in data/) and one
+    per subdirectory with files. "default" is left out when data/ only has subdirectories.
+    """
+    names = [DEFAULT_COLLECTION]
+    if os.path.isdir(data_dir):
+        for entry in sorted(os.listdir(data_dir)):
+            path = os.path.join(data_dir, entry)
+            if entry != DEFAULT_COLLECTION and os.path.isdir(path) and _has_sources(path):
+                names.append(entry)
+        if len(names) > 1 and not _has_sources(data_dir):
+            names.remove(DEFAULT_COLLECTION)
+    return names
+
+
+def collection_index_dir(collection, index_dir=INDEX_DIR):
+    """Directory of a collection's persisted shard."""
+    return index_dir if collection == DEFAULT_COLLECTION else os.path.join(index_dir, COLLECTIONS_DIR, collection)
+
+
+def _file_hash(path):
+    """SHA-256 of a source file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_manifest(files):
+    """Manifest that keys the index: source hashes, chunker settings and embedding model."""
+    return {
+        "version": INDEX_VERSION,
+        "embedding_model": EMBEDDING_MODEL,
+        "chunker": {"type": "structured", "per_page": True, "tokenizer": tokenizer_name(),
+                    "chunk_tokens": CHUNK_TOKENS, "overlap_tokens": CHUNK_OVERLAP_TOKENS},
+        "index": ann.index_settings(),
+        "files": {os.path.basename(path): _file_hash(path) for path in files},
+    }
+
+
+def _write_atomic(path, write):
+    """Write to a temp file and rename, so readers never see a half-written artifact."""
+    tmp_path = path + ".tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def save_index(index, chunks, manifest, index_dir=INDEX_DIR):
+    """Persist the index artifact. The manifest is written last and marks it complete."""
+    os.makedirs(index_dir, exist_ok=True)
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    _write_atomic(os.path.join(index_dir, INDEX_FILE), lambda p: faiss.write_index(index, p))
+
+    chunks.save(index_dir)
+    _write_atomic(os.path.join(index_dir, BM25_FILE), BM25Index.from_chunks(chunks).save)
+
+    def write_manifest(p):
+        with open(p, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+    _write_atomic(manifest_path, write_manifest)
+
+
+def read_manifest(index_dir=INDEX_DIR):
+    """Manifest of the persisted index, or None if there is no complete index."""
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
     try:
-        with open(pdf_path, 'rb') as pdf_file:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page_num in range(len(pdf_reader.pages)):
-                page = pdf_reader.pages[page_num]
-                text += page.extract_text()
-            
-            doc_name = os.path.basename(pdf_path)
-            if text.strip():  # Only add if text was extracted
-                documents.append(Document(page_content=text, metadata={"doc_name": doc_name}))
-                print(f"✓ Loaded {doc_name}")
-    except Exception as e:
-        print(f"⚠ Error loading {pdf_path}: {e}")
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
 
-# Load TXT files (for backward compatibility)
-txt_files = glob.glob(os.path.join(data_dir, "*.txt"))
-for txt_path in txt_files:
+def _same_settings(a, b):
+    """True if two manifests agree on everything except the source files."""
+    return all(a.get(key) == b.get(key) for key in ("version", "embedding_model", "chunker", "index"))
+
+
+def load_index(index_dir=INDEX_DIR, mmap=True):
+    """
+    Load the persisted index and its ChunkStore (keyed by FAISS row id), or None.
+    By default the FAISS file and the chunk store are memory-mapped so cold start
+    does not copy vectors or texts; pass mmap=False when they are going to be modified.
+    """
     try:
-        with open(txt_path, "r", encoding="utf-8") as f:
-            text = f.read()
-        doc_name = os.path.basename(txt_path)
-        documents.append(Document(page_content=text, metadata={"doc_name": doc_name}))
-        print(f"✓ Loaded {doc_name}")
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if mmap else 0
+        index = ann.configure(faiss.read_index(os.path.join(index_dir, INDEX_FILE), flags))
+        chunks = ChunkStore.load(index_dir, mmap_files=mmap)
     except Exception as e:
-        print(f"⚠ Error loading {txt_path}: {e}")
-
-# Split text into chunks with IDs for proper citations
-splitter = CharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-chunks = []
-for doc in documents:
-    doc_chunks = splitter.split_documents([doc])
-    for chunk_idx, chunk in enumerate(doc_chunks):
-        chunk.metadata["chunk_id"] = f"{chunk.metadata['doc_name']}__chunk_{chunk_idx}"
-        chunks.append(chunk)
-
-# Create embeddings and FAISS vector store
-embeddings = OpenAIEmbeddings()
-if chunks:
-    vector_store = FAISS.from_documents(chunks, embeddings)
-    print(f"✓ Vector store created with {len(chunks)} chunks from {len(documents)} documents")
-else:
-    print("⚠ Warning: No documents loaded. Vector store will be empty.")
-    vector_store = None
+        print(f"⚠ Could not load index from {index_dir}: {e}")
+        return None
+
+    if index.ntotal != len(chunks):
+        print(f"⚠ Index in {index_dir} is inconsistent ({index.ntotal} vectors, {len(chunks)} chunks)")
+        return None
+    return index, chunks
+
+
+def _add_chunks(index, chunks, files, next_id=0):
+    """
+    Stream chunks of `files` from the ingestion pipeline, embedding and adding them
+    to the index in batches as they arrive. Returns (index, number of chunks added).
+    If index is None it is created (see ann.create_index): on the first batch, or
+    for IVF-PQ once ANN_TRAIN_SIZE vectors have arrived to train it on.
+    """
+    from retrieval.ingest import ingest  # PDF and text-splitter imports are only needed when indexing
+
+    def create(pending):
+        vectors = np.vstack([v for v, _ in pending])
+        row_ids = np.concatenate([r for _, r in pending])
+        created, _ = ann.create_index(vectors)
+        created.add_with_ids(vectors, row_ids)
+        return created
+
+    stream = ingest(files, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS)
+    added = 0
+    pending = []  # (vectors, row_ids) held back until the index exists
+    while True:
+        batch = list(islice(stream, EMBED_BATCH_SIZE))
+        if not batch:
+            break
+        vectors = np.asarray(get_embeddings().embed_documents([indexed_text(c) for c in batch]), dtype="float32")
+        row_ids = np.arange(next_id + added, next_id + added + len(batch), dtype="int64")
+        chunks.extend(row_ids.tolist(), batch)
+        added += len(batch)
+        if index is not None:
+            index.add_with_ids(vectors, row_ids)
+            continue
+        pending.append((vectors, row_ids))
+        if not ann.needs_training() or sum(len(v) for v, _ in pending) >= ann.ANN_TRAIN_SIZE:
+            index, pending = create(pending), []
+    if pending:
+        index = create(pending)
+    return index, added
+
+
+def build_index(files):
+    """Ingest and embed all source files into an L2 index of type INDEX_TYPE keyed by row id."""
+    chunks = ChunkStore()
+    index, added = _add_chunks(None, chunks, files)
+    if index is None:
+        return None, chunks
+    print(f"✓ {ann.index_kind(index)} vector store created with {added} chunks from {len(chunks.documents())} documents")
+    return index, chunks
+
+
+def update_index(index, chunks, stored_manifest, manifest, files):
+    """
+    Incrementally bring a loaded index up to date with the source files.
+    Only chunks of new or changed files are embedded; vectors of deleted or changed
+    files are removed. Chunks of untouched files keep their row ids and vectors.
+    """
+    stored_files = stored_manifest["files"]
+    current_files = manifest["files"]
+    removed = {name for name in stored_files if name not in current_files}
+    changed = {name for name in current_files if name in stored_files and stored_files[name] != current_files[name]}
+    added = {name for name in current_files if name not in stored_files}
+
+    stale_ids = chunks.row_ids_of(removed | changed)
+    if stale_ids:
+        index = ann.remove_ids(index, stale_ids)
+        chunks.remove(stale_ids)
+
+    to_ingest = [path for path in files if os.path.basename(path) in changed | added]
+    index, embedded = _add_chunks(index, chunks, to_ingest, chunks.next_row_id())
+
+    print(f"✓ Vector store updated: {len(added)} added, {len(changed)} changed, {len(removed)} removed "
+          f"({len(stale_ids)} chunks dropped, {embedded} chunks embedded)")
+    return index, chunks
+
+
+def load_or_build_index(index_dir=INDEX_DIR, incremental=True, collection=DEFAULT_COLLECTION):
+    """
+    Load the persisted index of a collection. If source files changed, update it incrementally
+    (or rebuild when incremental=False); chunker or embedding changes always rebuild.
+    """
+    files = _source_files(collection)
+    manifest = build_manifest(files)
+    stored_manifest = read_manifest(index_dir)
+
+    if stored_manifest == manifest:
+        loaded = load_index(index_dir)
+        if loaded is not None:
+            index, chunks = loaded
+            print(f"✓ Loaded vector store with {len(chunks)} chunks from {index_dir}")
+            return index, chunks
+
+    elif incremental and stored_manifest is not None and _same_settings(stored_manifest, manifest):
+        loaded = load_index(index_dir, mmap=False)
+        if loaded is not None:
+            index, chunks = update_index(*loaded, stored_manifest, manifest, files)
+            if chunks:
+                save_index(index, chunks, manifest, index_dir)
+                return index, chunks
+
+    index, chunks = build_index(files)
+    if index is None:
+        print("⚠ Warning: No documents loaded. Vector store will be empty.")
+        return None, chunks
+    save_index(index, chunks, manifest, index_dir)
+    return index, chunks
+
+
+def load_lexical_index(chunks, index_dir=INDEX_DIR):
+    """Load the BM25 index persisted next to the FAISS index, rebuilding it if missing or stale."""
+    try:
+        lexical = BM25Index.load(os.path.join(index_dir, BM25_FILE))
+        if set(lexical.doc_len) == set(chunks):
+            return lexical
+    except (OSError, ValueError, KeyError):
+        pass
+    return BM25Index.from_chunks(chunks)
+
+
+class IndexStore:
+    """Loaded retrieval state of one collection: FAISS index, ChunkStore keyed by row id, BM25 index and manifest."""
+
+    def __init__(self, index, chunks, lexical, manifest, collection=DEFAULT_COLLECTION, index_dir=None):
+        self.index = index
+        self.index_type = ann.index_kind(index) if index is not None else None
+        self.chunks = chunks
+        self.lexical = lexical
+        self.manifest = manifest
+        #Hash of the manifest, computed once: it keys the query and response caches on every search
+        self.fingerprint = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+        self.collection = collection
+        usage = chunks.memory_usage()
+        index_path = os.path.join(index_dir, INDEX_FILE) if index_dir else ""
+        vector_bytes = os.path.getsize(index_path) if index is not None and os.path.exists(index_path) else 0
+        #Estimated footprint once searched: vectors (index file size), chunk store and BM25 postings
+        self.memory_bytes = vector_bytes + usage["heap_bytes"] + usage["mapped_bytes"] + lexical.memory_bytes()
+
+
+def _load_store(collection):
+    index_dir = collection_index_dir(collection)
+    index, chunks = load_or_build_index(index_dir, incremental=os.getenv("INDEX_INCREMENTAL", "1") != "0",
+                                        collection=collection)
+    return IndexStore(index, chunks, load_lexical_index(chunks, index_dir),
+                      read_manifest(index_dir) if index is not None else None, collection, index_dir)
+
+
+class ShardCache:
+    """
+    Loaded collection shards, least recently used first. A shard is loaded (or
+    built) on first use, once even under concurrent first queries. When the shards
+    together exceed max_bytes (see IndexStore.memory_bytes), the least recently used
+    ones are unloaded; the shard just used is always kept, and searches already
+    holding an unloaded shard finish on it.
+    """
+
+    def __init__(self, max_bytes=0):
+        self.max_bytes = max_bytes
+        self.shards = OrderedDict()  # collection -> IndexStore
+        self.stats = {"loads": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._loading = {}  # collection -> lock held while it loads
+
+    def get(self, collection):
+        with self._lock:
+            if collection in self.shards:
+                self.shards.move_to_end(collection)
+                return self.shards[collection]
+            load_lock = self._loading.setdefault(collection, threading.Lock())
+        with load_lock:
+            with self._lock:
+                if collection in self.shards:
+                    self.shards.move_to_end(collection)
+                    return self.shards[collection]
+            if collection not in list_collections():
+                raise KeyError(f"Unknown collection: {collection}")
+            store = _load_store(collection)
+            with self._lock:
+                self.shards[collection] = store
+                self.stats["loads"] += 1
+                self._evict()
+            return store
+
+    def _evict(self):
+        while self.max_bytes and len(self.shards) > 1 and self.memory_bytes() > self.max_bytes:
+            collection, _ = self.shards.popitem(last=False)
+            self.stats["evictions"] += 1
+            print(f"✓ Unloaded collection {collection} (shards above SHARD_MEMORY_MB)")
+
+    def memory_bytes(self):
+        return sum(store.memory_bytes for store in self.shards.values())
+
+    def loaded(self):
+        """{collection: estimated bytes} of the loaded shards, least recently used first."""
+        with self._lock:
+            return {collection: store.memory_bytes for collection, store in self.shards.items()}
+
+
+_shards = ShardCache(int(SHARD_MEMORY_MB * 1024 * 1024))
+
+
+def get_store(collection=None):
+    """
+    Process-wide retrieval state of a collection (default: the first in
+    list_collections()), loaded (or built) on first use and shared by every caller afterwards. Importing
+    this module does no I/O; the first retrieval from a collection pays for loading
+    its shard. Raises KeyError for a collection that is not in data/. Safe to wrap
+    in Streamlit's st.cache_resource.
+    """
+    return _shards.get(collection or list_collections()[0])
+
+
+def shard_stats():
+    """Loaded shards with their estimated bytes, plus load and eviction counts."""
+    return {"loaded": _shards.loaded(), **_shards.stats, "max_bytes": _shards.max_bytes}
+
+
+def _collections(collections):
+    """Selected collection names, deduplicated in order; None means every collection in data/."""
+    if isinstance(collections, str):
+        collections = [collections]
+    return list(dict.fromkeys(collections or list_collections()))
+
+
+def _fan_out(fn, names):
+    """fn(name) for every collection, in parallel threads (in the current trace) when there are several."""
+    if len(names) == 1:
+        return [fn(names[0])]
+    with ThreadPoolExecutor(max_workers=min(len(names), max(1, SHARD_SEARCH_WORKERS))) as pool:
+        futures = [pool.submit(tracing.in_context(fn), name) for name in names]  # a context can be entered once at a time
+        return [future.result() for future in futures]
+
+
+def index_fingerprint(collections=None):
+    """
+    Fingerprint of the selected collections' indexes: it changes whenever the corpus,
+    chunker or embedding model of any of them does.
+    """
+    names = _collections(collections)
+    if len(names) == 1:
+        return get_store(names[0]).fingerprint
+    joined = json.dumps({name: get_store(name).fingerprint for name in sorted(names)}, sort_keys=True)
+    return hashlib.sha256(joined.encode("utf-8")).hexdigest()
+
+RRF_K = 60  # reciprocal-rank fusion damping constant
+
+
+def _result(chunk, distance=None, bm25_score=None, lexical_confident=False, collection=DEFAULT_COLLECTION):
+    result = {
+        "text": chunk["text"],
+        "citation": chunk["chunk_id"],
+        "doc_name": chunk["doc_name"],
+        "page": chunk.get("page"),
+        "section": chunk.get("section"),
+        "collection": collection,
+        "similarity_score": float(distance) if distance is not None else None,
+        "supported": True
+    }
+    if bm25_score is not None:
+        result["bm25_score"] = round(float(bm25_score), 4)
+        result["lexical_confident"] = lexical_confident
+    return result
+
+
+def _lexical_search(store, query, k):
+    """BM25 ranking for a query and whether it is confident enough to skip dense search."""
+    hits, coverage = store.lexical.search(query, k)
+    margin_ok = len(hits) < 2 or hits[0][1] >= LEXICAL_MARGIN * hits[1][1]
+    confident = bool(hits) and coverage >= LEXICAL_CONFIDENT_COVERAGE and margin_ok
+    return [_result(store.chunks[row_id], bm25_score=score, lexical_confident=confident, collection=store.collection)
+            for row_id, score in hits], confident
+
+
+def _candidate_distances(candidates, query_vector):
+    """
+    L2 distance of every candidate to the query. Candidates found only by BM25 have
+    no FAISS distance; their vectors come from the embedding cache (chunks were
+    embedded at indexing time), so the reranker can compare them with the rest.
+    The computed distance is stored as the candidate's similarity_score.
+    """
+    distances = [r.get("similarity_score") for r in candidates]
+    missing = [j for j, distance in enumerate(distances) if distance is None]
+    if query_vector is None or not missing:
+        return distances
+    vectors = np.asarray(get_embeddings().embed_documents([indexed_text(candidates[j]) for j in missing]), dtype="float32")
+    for j, distance in zip(missing, ((vectors - query_vector) ** 2).sum(axis=1)):
+        distances[j] = candidates[j]["similarity_score"] = float(distance)
+    return distances
+
+
+def search_many(queries, k=3, mode=None, rerank=None, stats=None, collections=None):
+    """
+    Search several queries at once and return one ranked result list per query.
+    Dense search fetches all query embeddings in one batch and searches FAISS with a
+    single batched call. In hybrid mode BM25 runs first: confident lexical rankings
+    are returned as-is (no embedding call), the rest are fused with the dense ranking.
+    With reranking (RERANK, on by default) FAISS and BM25 over-fetch RERANK_FETCH_K
+    candidates and retrieval/reranker.py scores them all in one batch, keeping the top k.
+    Result lists are cached per query until the index changes. If stats is a dict,
+    rerank latency and query-cache hits are added to it.
+    collections selects the shards searched (default: every collection); several
+    are searched in parallel and each query's per-shard top k are merged into one
+    (see merge_shard_rankings). Results carry their "collection".
+    """
+    mode = mode or RETRIEVAL_MODE
+    rerank = reranker.RERANK if rerank is None else rerank
+    names = _collections(collections)
+    if not queries:
+        return []
+
+    def search_shard(name):
+        store = get_store(name)
+        if store.index is None:
+            return [[] for _ in queries], 0, {}, store.lexical
+        shard_stats = {}
+        rankings, cache_hits = _search_many(store, queries, k, mode, rerank, shard_stats)
+        return rankings, cache_hits, shard_stats, store.lexical
+
+    with tracing.span("retrieval.search", queries=len(queries), k=k, mode=mode, rerank=rerank,
+                      collections=len(names)) as span:
+        shards = _fan_out(search_shard, names)
+        span.set(query_cache_hits=sum(cache_hits for _, cache_hits, _, _ in shards))
+    if stats is not None:
+        for _, _, shard_stats, _ in shards:
+            _add_stats(stats, shard_stats)
+    if len(shards) == 1:
+        return shards[0][0]
+    lexical = MergedBM25(lexical for _, _, _, lexical in shards) if rerank else None
+    return merge_shard_rankings(queries, [[rankings[i] for rankings, _, _, _ in shards] for i in range(len(queries))],
+                                k, lexical)
+
+
+def _add_stats(stats, shard_stats):
+    for key in ("query_cache_hits", "reranked_queries", "rerank_candidates"):
+        if key in shard_stats:
+            stats[key] = stats.get(key, 0) + shard_stats[key]
+    if "rerank_ms" in shard_stats:
+        stats["rerank_ms"] = round(stats.get("rerank_ms", 0.0) + shard_stats["rerank_ms"], 2)
+        stats["rerank_ms_per_query"] = round(stats["rerank_ms"] / stats["reranked_queries"], 2)
+
+
+def merge_shard_rankings(queries, shard_rankings, k=3, lexical=None):
+    """
+    One top k per query from the rankings several shards returned for it (shard_rankings
+    holds, per query, one ranking per shard). Confident exact-term matches come first.
+    With lexical (MergedBM25 over the shards' BM25 indexes) the rest are reranked
+    together in one batch: BM25 statistics then cover every selected shard, and L2
+    distances are comparable across shards (same embedding model). Without it they
+    follow by distance, results without one last. Deduplicated by chunk_id.
+    """
+    pools = []
+    for rankings in shard_rankings:
+        entries = [(not result.get("lexical_confident", False),
+                    result["similarity_score"] if result.get("similarity_score") is not None else float("inf"),
+                    rank, result)
+                   for ranking in rankings for rank, result in enumerate(ranking)]
+        pool, seen = [], set()
+        for *_, result in sorted(entries, key=lambda entry: entry[:3]):
+            if result["citation"] not in seen:
+                seen.add(result["citation"])
+                pool.append(result)
+        pools.append(pool)
+    if lexical is None:
+        return [pool[:k] for pool in pools]
+
+    confident = [[r for r in pool if r.get("lexical_confident")][:k] for pool in pools]
+    rest = [[r for r in pool if not r.get("lexical_confident")] for pool in pools]
+    with tracing.span("retrieval.rerank", queries=len(queries), reranker=reranker.RERANKER,
+                      candidates=sum(len(candidates) for candidates in rest), merged=True):
+        reranked = reranker.rerank_many(queries, rest, k, lexical)
+    return [(top + more)[:k] for top, more in zip(confident, reranked)]
+
+
+def _search_many(store, queries, k, mode, rerank, stats):
+    fingerprint = store.fingerprint
+    keys = [(fingerprint, store.collection, mode, rerank and reranker.RERANKER, k, query) for query in queries]
+    rankings = [reranker.cache_get(key) for key in keys]
+    fresh = [i for i, ranking in enumerate(rankings) if ranking is None]
+    fetch_k = max(k, reranker.RERANK_FETCH_K) if rerank else k
+
+    candidates = [None] * len(queries)
+    lexical = [None] * len(queries)
+    if mode in ("lexical", "hybrid") and fresh:
+        with tracing.span("retrieval.bm25", queries=len(fresh)) as span:
+            for i in fresh:
+                lexical[i], confident = _lexical_search(store, queries[i], fetch_k)
+                if confident:
+                    rankings[i] = lexical[i][:k]
+                elif mode == "lexical":
+                    candidates[i] = lexical[i]
+            span.set(confident=sum(rankings[i] is not None for i in fresh))
+
+    dense_queries = [i for i in fresh if rankings[i] is None and candidates[i] is None]
+    query_vectors = {}
+    if dense_queries:
+        vectors = np.asarray(get_embeddings().embed_documents([queries[i] for i in dense_queries]), dtype="float32")
+        with tracing.span("retrieval.faiss", queries=len(dense_queries), k=fetch_k, index_type=store.index_type):
+            distances, rows = store.index.search(vectors, fetch_k)
+        for i, vector, query_distances, query_rows in zip(dense_queries, vectors, distances, rows):
+            query_vectors[i] = vector
+            dense = [_result(store.chunks[row], distance, collection=store.collection)
+                     for distance, row in zip(query_distances, query_rows) if row >= 0]
+            candidates[i] = fuse_rankings([dense, lexical[i]], fetch_k) if lexical[i] else dense
+
+    to_rank = [i for i in fresh if candidates[i] is not None]
+    rerank_sec = 0.0
+    if to_rank and rerank:
+        with tracing.span("retrieval.rerank", queries=len(to_rank), reranker=reranker.RERANKER,
+                          candidates=sum(len(candidates[i]) for i in to_rank)):
+            start = time.perf_counter()
+            distance_lists = [_candidate_distances(candidates[i], query_vectors.get(i)) for i in to_rank]
+            reranked = reranker.rerank_many([queries[i] for i in to_rank], [candidates[i] for i in to_rank], k,
+                                            store.lexical, distance_lists)
+            rerank_sec = time.perf_counter() - start
+    else:
+        reranked = [candidates[i][:k] for i in to_rank]
+    for i, ranking in zip(to_rank, reranked):
+        rankings[i] = ranking
+    for i in fresh:
+        reranker.cache_put(keys[i], rankings[i])
+
+    if stats is not None:
+        stats["query_cache_hits"] = stats.get("query_cache_hits", 0) + len(queries) - len(fresh)
+        if to_rank and rerank:
+            stats["reranked_queries"] = stats.get("reranked_queries", 0) + len(to_rank)
+            stats["rerank_candidates"] = stats.get("rerank_candidates", 0) + sum(len(candidates[i]) for i in to_rank)
+            stats["rerank_ms"] = round(stats.get("rerank_ms", 0.0) + rerank_sec * 1000, 2)
+            stats["rerank_ms_per_query"] = round(stats["rerank_ms"] / stats["reranked_queries"], 2)
+    return rankings, len(queries) - len(fresh)
+
+
+def fuse_rankings(rankings, k=3):
+    """
+    Merge ranked result lists with reciprocal-rank fusion, deduplicated by chunk_id.
+    Each fused result keeps its best (lowest) L2 score and best BM25 score, and
+    gets an rrf_score.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, result in enumerate(ranking):
+            chunk_id = result["citation"]
+            entry = fused.get(chunk_id)
+            if entry is None:
+                entry = fused[chunk_id] = dict(result, rrf_score=0.0)
+            else:
+                dense_scores = [s for s in (entry.get("similarity_score"), result.get("similarity_score")) if s is not None]
+                entry["similarity_score"] = min(dense_scores) if dense_scores else None
+                if "bm25_score" in result:
+                    entry["bm25_score"] = max(entry.get("bm25_score", 0.0), result["bm25_score"])
+                    entry["lexical_confident"] = entry.get("lexical_confident", False) or result["lexical_confident"]
+            entry["rrf_score"] += 1.0 / (RRF_K + rank + 1)
+    return sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:k]
+
+
+def _empty(collections):
+    return all(get_store(name).index is None for name in _collections(collections))
+
 
 # Retrieval function for Research Agent
-def retrieve(query, k=3):
-    """Retrieve documents with proper citations and chunk tracking."""
-    if vector_store is None:
+def retrieve(query, k=3, mode=None, stats=None, collections=None):
+    """
+    Retrieve documents with proper citations and chunk tracking (dense, lexical or hybrid,
+    reranked) from the selected collections (default: every collection).
+    """
+    if _empty(collections):
         return [{"text": "No documents available in vector store.", "citation": "N/A", "supported": False}]
-    
-    results = vector_store.similarity_search_with_score(query, k=k)
-    retrieved = []
-    for r in results:
-        chunk_id = r[0].metadata.get("chunk_id", "unknown")
-        doc_name = r[0].metadata.get("doc_name", "unknown")
-        retrieved.append({
-            "text": r[0].page_content,
-            "citation": chunk_id,
-            "doc_name": doc_name,
-            "similarity_score": float(r[1]),
-            "supported": True
-        })
-    return retrieved
+    return search_many([query], k, mode=mode, stats=stats, collections=collections)[0]
+
+
+def relevance_probe(query, mode=None, collections=None):
+    """
+    Cheapest evidence that the selected collections cover a query, for gating before
+    any LLM call: [(collection, L2 distance of its nearest chunk or None, whether BM25
+    found a confident exact-term match)] for every collection with an index. Dense
+    search is a single k=1 FAISS probe per shard, skipped when BM25 is confident in
+    any of them; nothing is reranked.
+    """
+    mode = mode or RETRIEVAL_MODE
+    stores = [store for store in _fan_out(get_store, _collections(collections)) if store.index is not None]
+    with tracing.span("retrieval.probe", mode=mode, collections=len(stores)) as span:
+        confident = [mode in ("lexical", "hybrid") and _lexical_search(store, query, 2)[1] for store in stores]
+        distances = [None] * len(stores)
+        if stores and not any(confident) and mode != "lexical":
+            vector = np.asarray(get_embeddings().embed_documents([query]), dtype="float32")
+            for i, store in enumerate(stores):
+                found, rows = store.index.search(vector, 1)
+                distances[i] = float(found[0][0]) if rows[0][0] >= 0 else None
+        span.set(distance=min((d for d in distances if d is not None), default=None), lexical_confident=any(confident))
+        return [(store.collection, distance, match) for store, distance, match in zip(stores, distances, confident)]
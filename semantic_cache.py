@@ -0,0 +1,106 @@
+# semantic_cache.py
+import os
+import json
+import time
+import sqlite3
+import threading
+
+import numpy as np
+
+from retrieval.vector_store import get_embeddings, index_fingerprint
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "1") != "0"
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "responses.sqlite"))
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))  # cosine similarity of tasks
+RESPONSE_CACHE_TTL_SEC = float(os.getenv("RESPONSE_CACHE_TTL_SEC", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+SIGNATURE_K = 3  # top chunks of the raw-task retrieval that must match for a hit
+
+_lock = threading.Lock()
+_conn = None
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(RESPONSE_CACHE_PATH)), exist_ok=True)
+        _conn = sqlite3.connect(RESPONSE_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "id INTEGER PRIMARY KEY, task TEXT NOT NULL, vector BLOB NOT NULL, chunk_ids TEXT NOT NULL, "
+            "fingerprint TEXT NOT NULL, deliverable TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+    return _conn
+
+
+def signature(task_results):
+    """Sorted chunk_ids of the top raw-task results; a cached run is only reused for the same evidence."""
+    return sorted({r["citation"] for r in task_results[:SIGNATURE_K] if r.get("citation") and r["citation"] != "N/A"})
+
+
+def _task_vector(task):
+    vector = np.asarray(get_embeddings().embed_query(task), dtype="float32")
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def _expire(db):
+    """
+    Drop entries past their TTL, then trim to the LRU cap. Entries of other indexes
+    (another collection selection, or an index since rebuilt) are never matched and
+    age out the same way.
+    """
+    db.execute("DELETE FROM responses WHERE created < ?", (time.time() - RESPONSE_CACHE_TTL_SEC,))
+    db.execute(
+        "DELETE FROM responses WHERE id NOT IN (SELECT id FROM responses ORDER BY last_used DESC LIMIT ?)",
+        (RESPONSE_CACHE_MAX_ENTRIES,)
+    )
+    db.commit()
+
+
+def lookup(task, chunk_ids, collections=None):
+    """
+    Find an earlier deliverable for a semantically similar task over the same
+    collections whose retrieved chunk_id set matches. Returns {"deliverable", "task",
+    "similarity"} or None.
+    """
+    if not RESPONSE_CACHE_ENABLED or not chunk_ids:
+        return None
+    vector = _task_vector(task)
+    fingerprint = index_fingerprint(collections)
+    with _lock:
+        db = _db()
+        _expire(db)
+        rows = db.execute(
+            "SELECT id, task, vector, deliverable FROM responses WHERE chunk_ids = ? AND fingerprint = ?",
+            (json.dumps(chunk_ids), fingerprint)
+        ).fetchall()
+        best = None
+        for row_id, cached_task, blob, deliverable in rows:
+            similarity = float(np.dot(vector, np.frombuffer(blob, dtype="float32")))
+            if similarity >= RESPONSE_CACHE_THRESHOLD and (best is None or similarity > best[0]):
+                best = (similarity, row_id, cached_task, deliverable)
+        if best is None:
+            return None
+        similarity, row_id, cached_task, deliverable = best
+        db.execute("UPDATE responses SET last_used = ? WHERE id = ?", (time.time(), row_id))
+        db.commit()
+    return {"deliverable": json.loads(deliverable), "task": cached_task, "similarity": round(similarity, 4)}
+
+
+def store(task, chunk_ids, deliverable, collections=None):
+    """Remember a finished deliverable for later similar tasks over the same collections."""
+    if not RESPONSE_CACHE_ENABLED or not chunk_ids:
+        return
+    vector = _task_vector(task)
+    fingerprint = index_fingerprint(collections)
+    now = time.time()
+    with _lock:
+        db = _db()
+        db.execute(
+            "INSERT INTO responses (task, vector, chunk_ids, fingerprint, deliverable, created, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (task, vector.tobytes(), json.dumps(chunk_ids), fingerprint, json.dumps(deliverable), now, now)
+        )
+        db.commit()
+        _expire(db)
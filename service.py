@@ -0,0 +1,315 @@
+"""
+HTTP service mode: an async API around graph.run_copilot for other internal systems.
+
+Jobs go into a bounded queue served by a fixed number of workers that share one
+warm index, embedding cache and LLM client pool. A request identical to one that
+is still queued or running (same normalized task, collections and cache setting) is coalesced
+onto that job instead of running twice. Progress can be polled or streamed as
+server-sent events.
+
+    python service.py --port 8000 --workers 8
+
+    curl -X POST localhost:8000/jobs -H 'Content-Type: application/json' -d '{"task": "..."}'
+    curl localhost:8000/jobs/<job_id>               # poll status, progress and result
+    curl -N localhost:8000/jobs/<job_id>/events     # server-sent events until done
+    curl -X POST localhost:8000/run -H 'Content-Type: application/json' -d '{"task": "..."}'  # wait for the result
+    curl -X POST localhost:8000/jobs -H 'Content-Type: application/json' -d '{"task": "...", "collections": ["security"]}'
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import argparse
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+import tracing
+from agents import llm
+from graph import run_copilot
+from retrieval.vector_store import get_store, list_collections, shard_stats
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "8"))  # copilot runs in flight
+SERVICE_QUEUE_SIZE = int(os.getenv("SERVICE_QUEUE_SIZE", "256"))  # queued jobs before new ones get 503
+SERVICE_MAX_JOBS = int(os.getenv("SERVICE_MAX_JOBS", "1000"))  # finished jobs kept for polling
+SSE_KEEPALIVE_SEC = 15
+
+
+class JobRequest(BaseModel):
+    task: str
+    use_cache: bool = True
+    collections: Optional[List[str]] = None  # document collections to answer from (default: all of them)
+
+
+class Job:
+    """One copilot run. Its fields are only touched on the event loop thread."""
+
+    def __init__(self, task, use_cache, key, loop, collections=None):
+        self.id = uuid.uuid4().hex
+        self.task = task
+        self.use_cache = use_cache
+        self.collections = collections
+        self.key = key
+        self.status = "queued"
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []  # progress events in order
+        self.token_subscribers = 0  # SSE streams with tokens=true; token deltas are only kept while one is attached
+        self.result = None
+        self.error = None
+        self.coalesced = 0
+        self.done = loop.create_future()
+        self._changed = asyncio.Event()
+
+    def publish(self, event):
+        if event["type"] == "token" and not self.token_subscribers:
+            return
+        self.events.append(event)
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def view(self, include_result=True):
+        view = {
+            "job_id": self.id,
+            "status": self.status,
+            "task": self.task,
+            "collections": self.collections,
+            "coalesced_requests": self.coalesced,
+            "queue_sec": round((self.started or time.time()) - self.created, 3),
+            "latency_sec": round(self.finished - self.started, 3) if self.finished and self.started else None,
+            "progress": [e for e in self.events if e["type"] in ("agent_start", "agent_end")],
+        }
+        if include_result and self.result is not None:
+            view["result"] = self.result
+        if self.error:
+            view["error"] = self.error
+        return view
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobQueue:
+    """Bounded job queue with `workers` async workers, each running one copilot pipeline in a thread."""
+
+    def __init__(self, workers=SERVICE_WORKERS, max_queued=SERVICE_QUEUE_SIZE, max_jobs=SERVICE_MAX_JOBS):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.queue = asyncio.Queue(maxsize=max_queued)
+        self.jobs = OrderedDict()
+        self.inflight = {}  # coalescing key -> queued or running job
+        self.stats = {"submitted": 0, "coalesced": 0, "rejected": 0, "completed": 0, "failed": 0}
+        self.running = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="copilot")
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def submit(self, task, use_cache=True, collections=None):
+        """Queue a job, or join the identical one already in flight. Returns (job, coalesced)."""
+        key = (" ".join(task.lower().split()), use_cache, tuple(sorted(set(collections))) if collections else None)
+        job = self.inflight.get(key)
+        if job is not None:
+            job.coalesced += 1
+            self.stats["coalesced"] += 1
+            return job, True
+        if self.queue.full():
+            self.stats["rejected"] += 1
+            raise QueueFull()
+        job = Job(task, use_cache, key, asyncio.get_running_loop(), collections)
+        self.jobs[job.id] = job
+        self.inflight[key] = job
+        self.queue.put_nowait(job)
+        self.stats["submitted"] += 1
+        return job, False
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job):
+        loop = asyncio.get_running_loop()
+        job.status = "running"
+        job.started = time.time()
+        self.running += 1
+        job.publish({"type": "job_start", "queue_sec": round(job.started - job.created, 3)})
+
+        def on_event(event):
+            loop.call_soon_threadsafe(job.publish, event)
+
+        def run():
+            with tracing.trace("service.job", job_id=job.id, queue_ms=round((job.started - job.created) * 1000, 3)):
+                trace = {}
+                deliverable, _, obs_table = run_copilot(job.task, use_cache=job.use_cache, on_event=on_event,
+                                                        trace_out=trace, collections=job.collections)
+            return {"deliverable": deliverable, "obs_table": obs_table, "trace_id": trace.get("trace_id")}
+
+        try:
+            job.result = await loop.run_in_executor(self._executor, run)
+            job.status = "done"
+            self.stats["completed"] += 1
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "error"
+            self.stats["failed"] += 1
+        finally:
+            job.finished = time.time()
+            self.running -= 1
+            if self.inflight.get(job.key) is job:
+                del self.inflight[job.key]
+            job.publish({"type": job.status, "latency_sec": round(job.finished - job.started, 3)})
+            job.done.set_result(None)
+            self._retire()
+
+    def _retire(self):
+        """Forget the oldest finished jobs beyond max_jobs."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self.jobs[job_id]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    #Load the index and create the LLM client before accepting requests, so the first job is not slow
+    loop = asyncio.get_running_loop()
+    store = await loop.run_in_executor(None, lambda: get_store(list_collections()[0]))
+    llm.get_client()
+    app.state.store = store
+    app.state.jobs = JobQueue(workers=SERVICE_WORKERS)
+    app.state.jobs.start()
+    print(f"✓ Copilot service ready: {len(store.chunks)} chunks, {SERVICE_WORKERS} workers")
+    yield
+    await app.state.jobs.stop()
+
+
+app = FastAPI(title="Supply Chain Copilot", lifespan=lifespan)
+
+
+def _submit(request):
+    unknown = sorted(set(request.collections or []) - set(list_collections()))
+    if unknown:
+        raise HTTPException(status_code=404, detail=f"Unknown collections: {', '.join(unknown)}")
+    try:
+        return app.state.jobs.submit(request.task, request.use_cache, request.collections)
+    except QueueFull:
+        raise HTTPException(status_code=503, detail="Job queue is full", headers={"Retry-After": "5"})
+
+
+def _job(job_id):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job id")
+    return job
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    """Queue a copilot run; an identical run already in flight is joined instead."""
+    job, coalesced = _submit(request)
+    return {"job_id": job.id, "status": job.status, "coalesced": coalesced,
+            "status_url": f"/jobs/{job.id}", "events_url": f"/jobs/{job.id}/events"}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status, agent progress and, once done, the deliverable of a job."""
+    return _job(job_id).view()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, tokens: bool = False):
+    """
+    Server-sent events for a job from its start: agent_start/agent_end, then done or error.
+    With tokens=true, Writer/Verifier token deltas too, from the time the stream attaches
+    (they are not kept for streams that did not ask for them).
+    """
+    job = _job(job_id)
+
+    async def stream():
+        sent = 0
+        if tokens:
+            job.token_subscribers += 1
+        try:
+            while True:
+                changed = job._changed
+                while sent < len(job.events):
+                    event = job.events[sent]
+                    sent += 1
+                    if event["type"] == "token" and not tokens:
+                        continue
+                    if event["type"] in ("done", "error"):
+                        event = dict(event, **job.view())
+                    yield f"event: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+                if job.finished:
+                    return
+                try:
+                    await asyncio.wait_for(changed.wait(), SSE_KEEPALIVE_SEC)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            if tokens:
+                job.token_subscribers -= 1
+
+    return StreamingResponse(stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.post("/run")
+async def run_job(request: JobRequest):
+    """Run (or join) a job and wait for its result."""
+    job, coalesced = _submit(request)
+    await asyncio.shield(job.done)
+    view = dict(job.view(), coalesced=coalesced)
+    return JSONResponse(view, status_code=200 if job.status == "done" else 500)
+
+
+@app.get("/health")
+async def health():
+    jobs = app.state.jobs
+    return {
+        "status": "ok",
+        "chunks": len(app.state.store.chunks),
+        "index_type": app.state.store.index_type,
+        "collections": list_collections(),
+        "shards": shard_stats(),
+        "workers": jobs.workers,
+        "running": jobs.running,
+        "queued": jobs.queue.qsize(),
+        "jobs": dict(jobs.stats),
+        "llm": dict(llm.stats),
+    }
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve the copilot over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS, help="copilot runs in flight")
+    args = parser.parse_args()
+
+    SERVICE_WORKERS = args.workers
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
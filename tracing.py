@@ -0,0 +1,291 @@
+# tracing.py
+import os
+import json
+import math
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+TRACE_ENABLED = os.getenv("TRACE", "1") != "0"
+TRACE_PATH = os.getenv("TRACE_PATH", os.path.join(os.path.dirname(__file__), ".cache", "traces.jsonl"))
+TRACE_MAX_MB = float(os.getenv("TRACE_MAX_MB", "50"))  # the file is rotated to .1 above this size
+TRACE_OTLP_ENDPOINT = os.getenv("TRACE_OTLP_ENDPOINT", "")  # OTLP/HTTP JSON, e.g. http://localhost:4318/v1/traces
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "supply-chain-copilot")
+
+_current = contextvars.ContextVar("current_span", default=None)
+_file_lock = threading.Lock()
+_otlp_warned = False
+
+
+class Span:
+    """One timed operation in a trace; times are perf_counter values."""
+
+    def __init__(self, trace, name, parent_id, attributes):
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = dict(attributes)
+        self.status = "ok"
+        self.start = time.perf_counter()
+        self.end = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        end = self.end if self.end is not None else time.perf_counter()
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start - self.trace.start) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+class _NoSpan:
+    """Stand-in returned outside a trace, so instrumented code never has to check."""
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+
+NO_SPAN = _NoSpan()
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = os.urandom(16).hex()
+        self.name = name
+        self.start = time.perf_counter()
+        self.start_unix_ns = time.time_ns()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted((s.to_dict() for s in self.spans), key=lambda s: s["start_ms"])
+        root = next((s for s in spans if s["parent_id"] is None), None)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.start_unix_ns / 1e9,
+            "duration_ms": root["duration_ms"] if root else None,
+            "spans": spans,
+        }
+
+
+def current_span():
+    """The innermost open span of this context (NO_SPAN outside a trace)."""
+    return _current.get() or NO_SPAN
+
+
+def current_trace():
+    """Snapshot of the trace this context belongs to (open spans run up to now), or None."""
+    current = _current.get()
+    return current.trace.to_dict() if current is not None else None
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block as a child of the current span. Outside a trace (e.g. while
+    indexing) this is a no-op yielding NO_SPAN. Exceptions mark the span as errored.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield NO_SPAN
+        return
+    current = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current.reset(token)
+        parent.trace.add(current)
+
+
+@contextmanager
+def trace(name, **attributes):
+    """
+    Start a trace whose root span covers the block. When it ends the trace is
+    appended to TRACE_PATH and, if TRACE_OTLP_ENDPOINT is set, sent to an
+    OpenTelemetry collector. Yields the root span; root.trace.to_dict() gives
+    the finished trace. Nested inside another trace it behaves like span().
+    """
+    if _current.get() is not None or not TRACE_ENABLED:
+        with span(name, **attributes) as current:
+            yield current
+        return
+    root = Span(Trace(name), name, None, attributes)
+    token = _current.set(root)
+    try:
+        yield root
+    except BaseException as e:
+        root.status = "error"
+        root.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        root.end = time.perf_counter()
+        _current.reset(token)
+        root.trace.add(root)
+        export(root.trace.to_dict(), root.trace)
+
+
+def in_context(fn):
+    """Wrap fn to run in a copy of the caller's context, so spans opened in a worker thread nest correctly."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def export(trace_dict, trace_obj=None):
+    """Append a finished trace to the JSONL sink and ship it to the OTLP collector if configured."""
+    if TRACE_PATH:
+        line = json.dumps(trace_dict, default=str) + "\n"
+        with _file_lock:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(TRACE_PATH)), exist_ok=True)
+                if os.path.exists(TRACE_PATH) and os.path.getsize(TRACE_PATH) > TRACE_MAX_MB * 1024 * 1024:
+                    os.replace(TRACE_PATH, TRACE_PATH + ".1")
+                with open(TRACE_PATH, "a", encoding="utf-8") as f:
+                    f.write(line)
+            except OSError as e:
+                print(f"⚠ Could not write trace to {TRACE_PATH} ({e})")
+    if TRACE_OTLP_ENDPOINT and trace_obj is not None:
+        threading.Thread(target=_send_otlp, args=(to_otlp(trace_dict, trace_obj),), daemon=True).start()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": value if isinstance(value, str) else json.dumps(value, default=str)}
+
+
+def to_otlp(trace_dict, trace_obj):
+    """OTLP/HTTP JSON payload (ExportTraceServiceRequest) for a finished trace."""
+    base = trace_obj.start_unix_ns
+    spans = []
+    for s in trace_dict["spans"]:
+        start = base + int(s["start_ms"] * 1e6)
+        otlp_span = {
+            "traceId": trace_dict["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(start),
+            "endTimeUnixNano": str(start + int(s["duration_ms"] * 1e6)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s["attributes"].items() if v is not None],
+            "status": {"code": 2 if s["status"] == "error" else 1},
+        }
+        if s["parent_id"]:
+            otlp_span["parentSpanId"] = s["parent_id"]
+        spans.append(otlp_span)
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "copilot.tracing"}, "spans": spans}],
+    }]}
+
+
+def _send_otlp(payload):
+    global _otlp_warned
+    import urllib.request
+    request = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=json.dumps(payload).encode("utf-8"),
+                                     headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        urllib.request.urlopen(request, timeout=5).close()
+    except Exception as e:
+        if not _otlp_warned:
+            print(f"⚠ Could not export trace to {TRACE_OTLP_ENDPOINT} ({type(e).__name__}: {e})")
+            _otlp_warned = True
+
+
+def load_traces(path=None, limit=500):
+    """The most recent traces from the JSONL sink (oldest first); a torn last line is skipped."""
+    path = path or TRACE_PATH
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = f.readlines()[-limit:]
+    traces = []
+    for line in lines:
+        try:
+            traces.append(json.loads(line))
+        except json.JSONDecodeError:
+            continue
+    return traces
+
+
+def _percentile(values, q):
+    """Nearest-rank percentile (q in 0-100)."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def span_percentiles(traces):
+    """Per span name across traces: count and p50/p95/max duration in ms, slowest p95 first."""
+    durations = {}
+    for trace_dict in traces:
+        for s in trace_dict.get("spans", []):
+            durations.setdefault(s["name"], []).append(s["duration_ms"])
+    rows = [{"span": name, "n": len(values), "p50_ms": round(_percentile(values, 50), 2),
+             "p95_ms": round(_percentile(values, 95), 2), "max_ms": round(max(values), 2)}
+            for name, values in durations.items()]
+    return sorted(rows, key=lambda row: row["p95_ms"], reverse=True)
+
+
+def rollup(trace_dict, group_attribute, span_name, fields):
+    """
+    Sum numeric attributes of every span named span_name into its nearest ancestor
+    carrying group_attribute, e.g. LLM tokens and cost per agent. Returns
+    {group value: {field: total, "calls": n}}.
+    """
+    by_id = {s["span_id"]: s for s in trace_dict.get("spans", [])}
+    totals = {}
+    for s in by_id.values():
+        if s["name"] != span_name:
+            continue
+        ancestor = by_id.get(s["parent_id"])
+        while ancestor is not None and group_attribute not in ancestor["attributes"]:
+            ancestor = by_id.get(ancestor["parent_id"])
+        if ancestor is None:
+            continue
+        group = totals.setdefault(ancestor["attributes"][group_attribute], {"calls": 0})
+        group["calls"] += 1
+        for field in fields:
+            value = s["attributes"].get(field)
+            if isinstance(value, (int, float)):
+                group[field] = group.get(field, 0) + value
+    return totals
+
+
+def waterfall(trace_dict):
+    """Spans in depth-first order with their nesting depth, for waterfall views."""
+    children = {}
+    for s in trace_dict.get("spans", []):
+        children.setdefault(s["parent_id"], []).append(s)
+    rows = []
+
+    def walk(parent_id, depth):
+        for s in sorted(children.get(parent_id, []), key=lambda s: s["start_ms"]):
+            rows.append(dict(s, depth=depth))
+            walk(s["span_id"], depth + 1)
+    walk(None, 0)
+    return rows